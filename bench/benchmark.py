@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import signal
+import argparse
+import tempfile
+import ipaddress
+import threading
+import subprocess
+import paramiko
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repo_dir, "lib"))
+
+from CoSSH.Utils.GroupRegistry import GroupRegistry
+from CoSSH.Utils.FileWriting import BatchEdit
+
+# benchmarks cossh of this source tree against fake routers (bench/fakerouter.py)
+# every scenario starts its own fake routers and registers them as a group, then runs cossh and measures it
+#
+# scenarios are <kind>-<number of routers>:
+#   group     login-group with facts, sws, create-user, upload-file and upload-cfg (backup/restore)
+#   firmware  login-group with update-fw
+#   online    cossh -o
+default_scenarios = ["group-10", "group-100", "group-1000", "firmware-10", "online-1000"]
+kinds = ("group", "firmware", "online")
+
+key_passwd = "cossh-bench"
+
+def parse_scenario(scenario):
+	kind, _, count = scenario.partition("-")
+
+	if not kind in kinds or not count.isdigit() or int(count) < 1:
+		raise argparse.ArgumentTypeError("Invalid scenario '" + scenario + "', use <" + "/".join(kinds) + ">-<number of routers>")
+
+	return kind, int(count)
+
+# writes a file of random bytes, a new digest every time so no cache lets cossh skip the transfer
+def write_random(path, size):
+	with open(path, "wb") as f:
+		while size > 0:
+			f.write(os.urandom(min(size, 1048576)))
+			size -= 1048576
+
+	return path
+
+# sum of resident memory of a process and all its descendants in kB, read from /proc
+def tree_rss(pid):
+	parents = {}
+	rss = {}
+	page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+
+	for entry in os.listdir("/proc"):
+		if not entry.isdigit():
+			continue
+
+		try:
+			with open("/proc/" + entry + "/stat") as f:
+				fields = f.read().rsplit(")", 1)[1].split()
+		except OSError:
+			continue
+
+		parents[int(entry)] = int(fields[1])
+		rss[int(entry)] = int(fields[21]) * page_kb
+
+	tree = {pid}
+	added = True
+
+	while added:
+		added = False
+		for child, parent in parents.items():
+			if parent in tree and not child in tree:
+				tree.add(child)
+				added = True
+
+	return sum(rss.get(process, 0) for process in tree)
+
+class Benchmark():
+
+	def __init__(self, work_dir, group="cossh-bench", router_args=None, cossh_args=None, firmware_size=32, address="127.0.10.1"):
+		self.work_dir = work_dir
+		self.group = group
+		self.router_args = router_args or []
+		self.cossh_args = cossh_args or []
+		self.firmware_size = firmware_size
+		self.address = address
+		self.registry = GroupRegistry()
+		self.key_file = "/etc/cossh/keys/cossh-key_" + group
+		self.routers = None
+		self.backup_file = None
+		self.cossh = None
+
+	# clients.conf is copied aside before the benchmark group is added, and put back by restore()
+	# a copy left behind by a benchmark that was killed must be restored by hand before running again
+	def prepare(self):
+		client_file = self.registry.client_file
+		backup_file = client_file + ".cossh-bench"
+
+		if os.path.exists(backup_file):
+			raise RuntimeError("'" + backup_file + "' was left by an earlier benchmark, copy it over '" + client_file + "' if the benchmark group is still there, then remove it")
+
+		if self.registry.has_group(self.group) or os.path.exists(self.key_file):
+			raise RuntimeError("Group '" + self.group + "' already exists, choose another one with --group")
+
+		shutil.copy2(client_file, backup_file)
+		self.backup_file = backup_file
+		self.create_key()
+
+	# group key, encrypted with key_passwd like keys cossh creates
+	def create_key(self):
+		key = paramiko.RSAKey.generate(2048)
+		key.write_private_key_file(self.key_file, password=key_passwd)
+
+		with open(self.key_file + ".pub", "w") as f:
+			f.write(key.get_name() + " " + key.get_base64() + " " + self.group + "\n")
+
+	# registers fake routers as the group, replacing routers of an earlier scenario
+	def register(self, count):
+		self.registry.delete_group(self.group)
+
+		members = ["@@" + self.group + "@@"]
+		members += [str(ipaddress.IPv4Address(self.address) + i) + ":BENCH" + str(i + 1).zfill(5) for i in range(count)]
+
+		with BatchEdit(self.registry.client_file) as batch:
+			batch.append_string("\n".join(members))
+
+	# puts clients.conf back as it was before prepare() and removes the group key
+	def restore(self):
+		if self.backup_file == None:
+			return
+
+		for path in (self.key_file, self.key_file + ".pub"):
+			if os.path.exists(path):
+				os.remove(path)
+
+		if os.path.exists(self.backup_file):
+			with BatchEdit(self.registry.client_file):
+				shutil.copyfile(self.backup_file, self.registry.client_file)
+
+			os.remove(self.backup_file)
+
+		self.backup_file = None
+
+	def start_routers(self, count):
+		root_dir = os.path.join(self.work_dir, "routers")
+		shutil.rmtree(root_dir, ignore_errors=True)
+
+		command = [sys.executable, os.path.join(repo_dir, "bench", "fakerouter.py"), "--routers", str(count),
+			"--address", self.address, "--root", root_dir] + self.router_args
+		self.routers = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+
+		line = self.routers.stdout.readline()
+
+		if not line.startswith("ready"):
+			self.stop_routers()
+			raise RuntimeError("Fake routers didn't start")
+
+	def stop_routers(self):
+		if self.routers != None:
+			self.routers.terminate()
+			self.routers.wait()
+			self.routers = None
+
+	# stops a cossh run and its workers, cossh runs in a session (and process group) of its own
+	def stop_cossh(self):
+		if self.cossh != None:
+			try:
+				os.killpg(self.cossh.pid, signal.SIGTERM)
+				os.waitpid(self.cossh.pid, 0)
+			except OSError:
+				pass
+
+			self.cossh = None
+
+	# runs cossh of this source tree, measures wall time, CPU time and memory of cossh and its workers
+	# returns the measurements and cossh's output
+	def run_cossh(self, cossh_args, stdin_text=""):
+		env = dict(os.environ)
+		env["PYTHONPATH"] = os.path.join(repo_dir, "lib") + os.pathsep + env.get("PYTHONPATH", "")
+
+		output = tempfile.TemporaryFile(mode="w+", dir=self.work_dir)
+		started = time.monotonic()
+
+		# a new session has no controlling terminal, so cossh reads the password from stdin
+		process = subprocess.Popen([sys.executable, os.path.join(repo_dir, "bin", "cossh")] + cossh_args + self.cossh_args,
+			stdin=subprocess.PIPE, stdout=output, stderr=subprocess.STDOUT, cwd=self.work_dir, env=env,
+			universal_newlines=True, start_new_session=True)
+
+		self.cossh = process
+		process.stdin.write(stdin_text)
+		process.stdin.close()
+
+		# memory of the whole process tree is sampled, workers of a pool don't show in the rusage of cossh
+		peak = [0]
+		finished = threading.Event()
+
+		def sample():
+			while not finished.wait(0.1):
+				peak[0] = max(peak[0], tree_rss(process.pid))
+
+		sampler = threading.Thread(target=sample, daemon=True)
+		sampler.start()
+
+		pid, status, usage = os.wait4(process.pid, 0)
+		self.cossh = None
+		wall = time.monotonic() - started
+		process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status
+
+		finished.set()
+		sampler.join()
+
+		output.seek(0)
+		text = output.read()
+		output.close()
+
+		# rusage of a waited process includes its waited descendants, ru_maxrss is the largest single process
+		measurements = {"wall": round(wall, 3),
+				"cpu_user": round(usage.ru_utime, 3),
+				"cpu_system": round(usage.ru_stime, 3),
+				"peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+				"peak_tree_rss_mb": round(peak[0] / 1024, 1),
+				"exit_status": process.returncode}
+
+		return measurements, text
+
+	# cossh configuration of a scenario
+	def write_config(self, kind):
+		path = os.path.join(self.work_dir, kind + ".cfg")
+		lines = ["login-group = " + self.group]
+
+		if kind == "group":
+			router_cfg = os.path.join(self.work_dir, "router.cfg")
+
+			with open(router_cfg, "w") as f:
+				f.write("ETH_IPADDR=192.168.50.1\nETH_NETMASK=255.255.255.0\nSNMP_ENABLED=1\nSNMP_NAME=bench\n")
+
+			lines += ["router-command = status -v sys",
+				"sws = SNMP_NAME=$serial, SNMP_LOCATION=bench",
+				"create-user = bench, B3nchpass, regular",
+				"upload-file = " + write_random(os.path.join(self.work_dir, "payload.bin"), 65536) + ", /root/",
+				"upload-cfg = " + router_cfg + ", standard"]
+
+		elif kind == "firmware":
+			lines += ["update-fw = " + write_random(os.path.join(self.work_dir, "firmware.bin"), self.firmware_size * 1048576)]
+
+		with open(path, "w") as f:
+			f.write("\n".join(lines) + "\n")
+
+		return path
+
+	def run(self, kind, count):
+		self.register(count)
+		self.start_routers(count)
+
+		try:
+			if kind == "online":
+				measurements, text = self.run_cossh(["-o", self.group, "--probe-json", "-"])
+				results = {"online": 0, "offline": 0}
+
+				try:
+					for router in json.loads(text):
+						results["online" if router["online"] else "offline"] += 1
+				except (ValueError, KeyError, TypeError):
+					pass
+			else:
+				measurements, text = self.run_cossh(["-f", self.write_config(kind), "--json"], key_passwd + "\n")
+				latest = {}
+
+				# retried routers are printed once for every attempt, the last result counts
+				for line in text.splitlines():
+					try:
+						router = json.loads(line)
+						latest[router["ip"]] = router["result"]
+					except (ValueError, KeyError, TypeError):
+						continue
+
+				results = {}
+				for result in latest.values():
+					results[result] = results.get(result, 0) + 1
+		finally:
+			self.stop_routers()
+
+		row = {"scenario": kind + "-" + str(count), "routers": count}
+		row.update(measurements)
+		row["results"] = results
+
+		return row, text
+
+def print_table(rows):
+	header = ["scenario", "routers", "wall s", "user s", "sys s", "rss MB", "tree MB", "results"]
+	table = [header]
+
+	for row in rows:
+		results = ", ".join(name + " " + str(count) for name, count in sorted(row["results"].items()))
+		table.append([row["scenario"], str(row["routers"]), str(row["wall"]), str(row["cpu_user"]), str(row["cpu_system"]),
+			str(row["peak_rss_mb"]), str(row["peak_tree_rss_mb"]), results])
+
+	widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+
+	for line in table:
+		print("  ".join(line[i].ljust(widths[i]) for i in range(len(header))).rstrip())
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Benchmark cossh against fake routers")
+	parser.add_argument("scenarios", metavar="SCENARIO", nargs="*", type=parse_scenario, help="<group/firmware/online>-<routers> (default " + " ".join(default_scenarios) + ")")
+	parser.add_argument("--repeat", metavar="[N]", type=int, default=1, help="Run every scenario N times (default 1)")
+	parser.add_argument("--cossh-args", metavar="[ARGS]", default="", help="More arguments for cossh, e.g. '--engine thread --max-parallel 200'")
+	parser.add_argument("--latency", metavar="[SECONDS]", type=float, help="Latency of fake routers")
+	parser.add_argument("--bandwidth", metavar="[BYTES/S]", type=float, help="Bandwidth of every fake router")
+	parser.add_argument("--failure-rate", metavar="[P]", type=float, help="Share of connections fake routers close before SSH handshake")
+	parser.add_argument("--drop-rate", metavar="[P]", type=float, help="Share of remote commands that close the SSH connection")
+	parser.add_argument("--seed", metavar="[N]", type=int, help="Seed of injected failures")
+	parser.add_argument("--firmware-size", metavar="[MB]", type=int, default=32, help="Size of firmware file (default 32)")
+	parser.add_argument("--address", metavar="[IPv4]", default="127.0.10.1", help="Address of the first fake router (default 127.0.10.1)")
+	parser.add_argument("--group", metavar="[GROUP]", default="cossh-bench", help="Group fake routers are registered as (default cossh-bench)")
+	parser.add_argument("--json", metavar="[FILE]", help="Append results to FILE, one JSON object per scenario run")
+	parser.add_argument("--output", action="store_true", help="Print output of cossh")
+
+	args = parser.parse_args()
+
+	scenarios = args.scenarios or [parse_scenario(scenario) for scenario in default_scenarios]
+
+	router_args = []
+	for option in ("latency", "bandwidth", "failure_rate", "drop_rate", "seed"):
+		if getattr(args, option) != None:
+			router_args += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+
+	work_dir = tempfile.mkdtemp(prefix="cossh-bench-")
+	bench = Benchmark(work_dir, args.group, router_args, shlex.split(args.cossh_args), args.firmware_size, args.address)
+
+	# killing the benchmark still restores clients.conf
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+	rows = []
+
+	try:
+		bench.prepare()
+
+		for kind, count in scenarios:
+			for i in range(args.repeat):
+				row, text = bench.run(kind, count)
+				row["cossh_args"] = args.cossh_args
+				rows.append(row)
+
+				if args.output == True:
+					print(text)
+
+				print_table([row])
+
+				if args.json != None:
+					with open(args.json, "a") as f:
+						f.write(json.dumps(row, sort_keys=True) + "\n")
+	except KeyboardInterrupt:
+		pass
+	except RuntimeError as e:
+		print(e)
+	finally:
+		bench.stop_cossh()
+		bench.stop_routers()
+		bench.restore()
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+	if len(rows) > 1:
+		print()
+		print_table(rows)
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import os
+import re
+import sys
+import time
+import random
+import logging
+import socket
+import argparse
+import resource
+import selectors
+import threading
+import ipaddress
+import subprocess
+import paramiko
+from paramiko import SFTPServer, SFTPServerInterface, SFTPHandle, SFTPAttributes, SFTP_OK
+
+# fake routers for benchmarking cossh, every router is an SSH/SFTP server on its own loopback address
+# commands run on this host with sh, inside the router's own directory: absolute paths cossh uses
+# (/root, /opt, /tmp, /etc...) are rewritten to the router's directory, and commands that only routers
+# have (status, backup, restore, fwupdate...) are small shell scripts reading and writing that directory
+# this is not a security boundary, run fake routers only on a test machine
+
+# directories of a router, absolute paths starting with these are rewritten
+router_dirs = ("root", "opt", "tmp", "etc", "home", "var")
+router_path = re.compile("(?<![\\w/.:~-])/(" + "|".join(router_dirs) + ")(?=/|\\s|$|['\";|&)*])")
+
+# router commands, $ROUTER_ROOT is the router's directory
+shims = {"status": """
+# status -v sys|module
+cat "$ROUTER_ROOT/etc/status.$2" 2>/dev/null || exit 1
+""",
+	"ifconfig": """
+cat "$ROUTER_ROOT/etc/ifconfig.$1" 2>/dev/null || exit 1
+""",
+	"backup": """
+# prints router's configuration, settings of every settings file
+echo "PROFILE="
+cat "$ROUTER_ROOT"/etc/settings.*
+""",
+	"restore": """
+# restore <file>, settings of the file replace all the settings
+[ -f "$1" ] || exit 1
+rm -f "$ROUTER_ROOT"/etc/settings.*
+grep -v '^PROFILE=' "$1" > "$ROUTER_ROOT/etc/settings.std"
+""",
+	"fwupdate": """
+# fwupdate -i <file> -n, the firmware file is only checked for existence
+[ "$1" = "-i" ] && [ -s "$2" ] || exit 1
+basename "$2" > "$ROUTER_ROOT/etc/firmware"
+""",
+	"openssl": """
+# openssl md5 <file>
+[ "$1" = "md5" ] && [ -f "$2" ] || exit 1
+md5sum "$2" |awk '{print "MD5(" $2 ")= " $1}'
+""",
+	"id": """
+# id -u <user>, only users of the router are known
+[ "$1" = "-u" ] && shift
+grep "^$1:" "$ROUTER_ROOT/etc/passwd" |cut -d: -f3 |grep .
+""",
+	"adduser": """
+# adduser -D [-S] <user> [-G <group>|<group>]
+user=""
+while [ $# -gt 0 ]; do
+	case "$1" in
+		-G) shift ;;
+		-*) ;;
+		*) [ -z "$user" ] && user="$1" ;;
+	esac
+	shift
+done
+[ -n "$user" ] || exit 1
+grep -q "^$user:" "$ROUTER_ROOT/etc/passwd" && exit 1
+uid=$((1000 + $(wc -l < "$ROUTER_ROOT/etc/passwd")))
+echo "$user:x:$uid:$uid::/home/$user:/bin/sh" >> "$ROUTER_ROOT/etc/passwd"
+""",
+	"deluser": """
+grep -q "^$1:" "$ROUTER_ROOT/etc/passwd" || exit 1
+grep -v "^$1:" "$ROUTER_ROOT/etc/passwd" > "$ROUTER_ROOT/etc/passwd.new"
+mv "$ROUTER_ROOT/etc/passwd.new" "$ROUTER_ROOT/etc/passwd"
+""",
+	"chpasswd": """
+# chpasswd -m, reads user:password lines from stdin
+while IFS=: read user password; do
+	grep -q "^$user:" "$ROUTER_ROOT/etc/passwd" || exit 1
+	grep -v "^$user:" "$ROUTER_ROOT/etc/shadow" > "$ROUTER_ROOT/etc/shadow.new"
+	echo "$user:$(echo "$password" |md5sum |cut -d' ' -f1)" >> "$ROUTER_ROOT/etc/shadow.new"
+	mv "$ROUTER_ROOT/etc/shadow.new" "$ROUTER_ROOT/etc/shadow"
+done
+""",
+	"reboot": """
+date > "$ROUTER_ROOT/tmp/rebooted"
+""",}
+
+# settings files of a new router, settings are spread over several files like in real routers
+settings = {"eth": ["ETH_ENABLED=1", "ETH_DHCP_ENABLED=0", "ETH_IPADDR=192.168.1.1", "ETH_NETMASK=255.255.255.0"],
+	"ppp": ["PPP_ENABLED=1", "PPP_APN=internet", "PPP_USERNAME=", "PPP_PASSWORD="],
+	"snmp": ["SNMP_ENABLED=0", "SNMP_NAME=", "SNMP_LOCATION=", "SNMP_CONTACT="],
+	"nat": ["NAT_ENABLED=1", "NAT_DEFAULT_SERVER="],}
+
+def write_file(path, lines, mode=0o644):
+	with open(path, "w") as f:
+		f.write("\n".join(lines) + "\n")
+	os.chmod(path, mode)
+
+# writes router commands to bin_dir, the same scripts are used by every router
+def write_shims(bin_dir):
+	os.makedirs(bin_dir, exist_ok=True)
+
+	for name, script in shims.items():
+		write_file(os.path.join(bin_dir, name), ["#!/bin/sh" + script.rstrip()], 0o755)
+
+# bandwidth of router's link, shared by every transfer of the router
+# transfers queue behind each other, so the link is never faster than its bandwidth
+class Link():
+
+	def __init__(self, bandwidth=None):
+		self.bandwidth = bandwidth
+		self.free_at = 0
+		self.lock = threading.Lock()
+
+	def transfer(self, nbytes):
+		if self.bandwidth == None or nbytes == 0:
+			return
+
+		with self.lock:
+			now = time.time()
+			self.free_at = max(now, self.free_at) + nbytes / self.bandwidth
+			delay = self.free_at - now
+
+		time.sleep(delay)
+
+class FakeRouter():
+
+	def __init__(self, ip_address, number, root_dir, bin_dir, latency=0, bandwidth=None, drop_rate=0):
+		self.ip_address = ip_address
+		self.serial = "BENCH" + str(number).zfill(5)
+		self.number = number
+		self.root = os.path.join(root_dir, ip_address)
+		self.bin_dir = bin_dir
+		self.latency = latency
+		self.drop_rate = drop_rate
+		self.link = Link(bandwidth)
+
+	# creates router's directory with a new router's settings and status
+	def create(self):
+		for directory in router_dirs:
+			os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+
+		etc = os.path.join(self.root, "etc")
+		mac = "00:0A:14:" + ":".join("%02X" % ((self.number >> shift) & 0xff) for shift in (16, 8, 0))
+
+		write_file(os.path.join(etc, "status.sys"), ["Product Name     : SPECTRE-v3-LTE",
+			"Product Type     : SPECTRE-v3-LTE",
+			"Firmware Version : 6.2.0 (2018-01-01)",
+			"Serial Number    : " + self.serial])
+		write_file(os.path.join(etc, "status.module"), ["IMEI  : 35" + str(self.number).zfill(13),
+			"ICCID : 8935" + str(self.number).zfill(15)])
+		write_file(os.path.join(etc, "ifconfig.eth0"), ["eth0      Link encap:Ethernet  HWaddr " + mac])
+		write_file(os.path.join(etc, "passwd"), ["root:x:0:0:root:/root:/bin/sh"])
+		write_file(os.path.join(etc, "shadow"), ["root:x"])
+
+		for name, lines in settings.items():
+			write_file(os.path.join(etc, "settings." + name), lines)
+
+	# injected round trip time
+	def delay(self):
+		if self.latency > 0:
+			time.sleep(self.latency)
+
+	# maps a path of the router to a path on this host
+	def path(self, path):
+		return self.root + os.path.normpath("/" + path)
+
+	def sandbox(self, command):
+		return router_path.sub(lambda match: self.root + match.group(0), command)
+
+	# runs a remote command, output is sent at the speed of router's link
+	def execute(self, channel, command):
+		try:
+			self.delay()
+
+			# injected connection loss
+			if self.drop_rate > 0 and random.random() < self.drop_rate:
+				channel.get_transport().close()
+				return
+
+			env = {"PATH": self.bin_dir + ":" + os.environ.get("PATH", "/usr/bin:/bin"),
+				"HOME": os.path.join(self.root, "root"),
+				"ROUTER_ROOT": self.root}
+			process = subprocess.run(["/bin/sh", "-c", self.sandbox(command)], stdin=subprocess.DEVNULL,
+				stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=env["HOME"])
+
+			self.link.transfer(len(process.stdout) + len(process.stderr))
+			channel.sendall(process.stdout)
+			channel.sendall_stderr(process.stderr)
+			channel.send_exit_status(process.returncode)
+			channel.shutdown_write()
+
+			# the reply to the exec request is sent after check_channel_exec_request returns, a channel
+			# closed before the reply fails the command in the client, so the client gets time to close it first
+			for i in range(20):
+				if channel.closed:
+					break
+				time.sleep(0.05)
+
+			channel.close()
+		except (OSError, EOFError, paramiko.SSHException):
+			channel.close()
+
+class RouterServer(paramiko.ServerInterface):
+
+	def __init__(self, router):
+		self.router = router
+
+	# any user, password and key is accepted
+	def get_allowed_auths(self, username):
+		return "publickey,password"
+
+	def check_auth_publickey(self, username, key):
+		self.router.delay()
+		return paramiko.AUTH_SUCCESSFUL
+
+	def check_auth_password(self, username, password):
+		self.router.delay()
+		return paramiko.AUTH_SUCCESSFUL
+
+	def check_channel_request(self, kind, chanid):
+		if kind == "session":
+			return paramiko.OPEN_SUCCEEDED
+
+		return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+	def check_channel_exec_request(self, channel, command):
+		threading.Thread(target=self.router.execute, args=(channel, command.decode()), daemon=True).start()
+		return True
+
+class RouterHandle(SFTPHandle):
+
+	def __init__(self, router, flags=0):
+		SFTPHandle.__init__(self, flags)
+		self.router = router
+
+	def read(self, offset, length):
+		data = SFTPHandle.read(self, offset, length)
+
+		if isinstance(data, bytes):
+			self.router.link.transfer(len(data))
+
+		return data
+
+	def write(self, offset, data):
+		self.router.link.transfer(len(data))
+		return SFTPHandle.write(self, offset, data)
+
+	def stat(self):
+		try:
+			return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+	def chattr(self, attr):
+		try:
+			SFTPServer.set_file_attr(self.filename, attr)
+			return SFTP_OK
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+	def close(self):
+		self.router.delay()
+		SFTPHandle.close(self)
+
+# SFTP server of a router, paths are in router's directory
+class RouterSFTP(SFTPServerInterface):
+
+	def __init__(self, server, *args, **kwargs):
+		SFTPServerInterface.__init__(self, server, *args, **kwargs)
+		self.router = server.router
+
+	def open(self, path, flags, attr):
+		self.router.delay()
+		path = self.router.path(path)
+
+		try:
+			fd = os.open(path, flags, 0o644)
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+		if flags & os.O_WRONLY:
+			mode = "ab" if flags & os.O_APPEND else "wb"
+		elif flags & os.O_RDWR:
+			mode = "a+b" if flags & os.O_APPEND else "r+b"
+		else:
+			mode = "rb"
+
+		handle = RouterHandle(self.router, flags)
+		handle.filename = path
+		handle.readfile = handle.writefile = os.fdopen(fd, mode)
+		return handle
+
+	def stat(self, path):
+		self.router.delay()
+
+		try:
+			return SFTPAttributes.from_stat(os.stat(self.router.path(path)))
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+	def lstat(self, path):
+		return self.stat(path)
+
+	def list_folder(self, path):
+		self.router.delay()
+		path = self.router.path(path)
+
+		try:
+			return [SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name) for name in os.listdir(path)]
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+	def remove(self, path):
+		return self.call(os.remove, path)
+
+	def rename(self, oldpath, newpath):
+		return self.call(os.rename, oldpath, newpath)
+
+	def posix_rename(self, oldpath, newpath):
+		return self.call(os.rename, oldpath, newpath)
+
+	def mkdir(self, path, attr):
+		return self.call(os.mkdir, path)
+
+	def rmdir(self, path):
+		return self.call(os.rmdir, path)
+
+	def chattr(self, path, attr):
+		try:
+			SFTPServer.set_file_attr(self.router.path(path), attr)
+			return SFTP_OK
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+	# runs a file operation with router's paths
+	def call(self, function, *paths):
+		self.router.delay()
+
+		try:
+			function(*[self.router.path(path) for path in paths])
+			return SFTP_OK
+		except OSError as e:
+			return SFTPServer.convert_errno(e.errno)
+
+# serves all routers from one process, every SSH connection gets its own thread
+class FakeRouters():
+
+	def __init__(self, routers, port=22, host_key=None, failure_rate=0):
+		self.routers = routers
+		self.port = port
+		self.host_key = host_key or paramiko.RSAKey.generate(2048)
+		self.failure_rate = failure_rate
+		self.selector = selectors.DefaultSelector()
+
+	def listen(self):
+		for router in self.routers:
+			sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			sock.bind((router.ip_address, self.port))
+			sock.listen(128)
+			sock.setblocking(False)
+			self.selector.register(sock, selectors.EVENT_READ, router)
+
+	def serve_forever(self):
+		while True:
+			for key, events in self.selector.select():
+				try:
+					conn, address = key.fileobj.accept()
+				except OSError:
+					continue
+
+				# injected connection failure, router closes the connection before SSH handshake
+				if self.failure_rate > 0 and random.random() < self.failure_rate:
+					conn.close()
+					continue
+
+				conn.setblocking(True)
+				threading.Thread(target=self.handle, args=(conn, key.data), daemon=True).start()
+
+	def handle(self, conn, router):
+		transport = paramiko.Transport(conn)
+		transport.add_server_key(self.host_key)
+		transport.set_subsystem_handler("sftp", SFTPServer, RouterSFTP)
+
+		try:
+			transport.start_server(server=RouterServer(router))
+		except (OSError, EOFError, paramiko.SSHException):
+			transport.close()
+
+# every connection and remote command holds file descriptors, so the limit is raised as far as allowed
+def raise_fd_limit():
+	soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+	if hard == resource.RLIM_INFINITY or hard > soft:
+		resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description="Fake routers for benchmarking cossh")
+	parser.add_argument("--routers", metavar="[N]", type=int, default=10, help="Number of routers (default 10)")
+	parser.add_argument("--address", metavar="[IPv4]", default="127.0.10.1", help="Address of the first router, the rest get the following addresses (default 127.0.10.1)")
+	parser.add_argument("--port", metavar="[PORT]", type=int, default=22, help="SSH port of routers (default 22)")
+	parser.add_argument("--root", metavar="[DIR]", required=True, help="Directory for routers' files, every router gets its own directory")
+	parser.add_argument("--latency", metavar="[SECONDS]", type=float, default=0, help="Added to authentication, every remote command and SFTP request except reads and writes")
+	parser.add_argument("--bandwidth", metavar="[BYTES/S]", type=float, help="Bandwidth of every router's link (default unlimited)")
+	parser.add_argument("--failure-rate", metavar="[P]", type=float, default=0, help="Share of connections closed before SSH handshake")
+	parser.add_argument("--drop-rate", metavar="[P]", type=float, default=0, help="Share of remote commands that close the SSH connection instead of running")
+	parser.add_argument("--seed", metavar="[N]", type=int, help="Seed of injected failures")
+
+	args = parser.parse_args()
+
+	# clients closing their connections are not errors of fake routers
+	logging.getLogger("paramiko").addHandler(logging.NullHandler())
+
+	if args.seed != None:
+		random.seed(args.seed)
+
+	raise_fd_limit()
+
+	root_dir = os.path.abspath(args.root)
+	bin_dir = os.path.join(root_dir, "bin")
+	write_shims(bin_dir)
+
+	first = ipaddress.IPv4Address(args.address)
+	routers = [FakeRouter(str(first + i), i + 1, root_dir, bin_dir, args.latency, args.bandwidth, args.drop_rate) for i in range(args.routers)]
+
+	for router in routers:
+		router.create()
+
+	server = FakeRouters(routers, args.port, failure_rate=args.failure_rate)
+	server.listen()
+
+	# the benchmark waits for this line before starting cossh
+	print("ready " + str(len(routers)), flush=True)
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+from collections import namedtuple
+
+# a single instruction read from cossh configuration file
+# args are already split and normalized, line is the line number in cossh configuration file
+# and variables lists router specific variables ($serial, $mac...) which are resolved later in router
+class Operation(namedtuple("Operation", ["name", "args", "line", "variables"])):
+	__slots__ = ()
+
+	# SSHConfiguration functions take their arguments as a comma separated string
+	def argline(self):
+		return ",".join(self.args)
+
+	# name of the SSHConfiguration function implementing the operation
+	def method(self):
+		return self.name.replace("-", "_")
+
+class CosshPlan():
+
+	# available functions and the amount of arguments each of them requires
+	functions = {"create-user": 3,
+		     "change-passwd": 2,
+		     "add-um": 1,
+		     "update-fw": 1,
+		     "upload-cfg": 2,
+		     "upload-file": 2,
+		     "delete-user": 1,
+		     "sws": 1,
+		     "reboot": 0,
+		     "write-excel": 4,
+		     "router-command": 1,
+		     "add-client": 2,
+		     "latest-update": 1,
+		     "remove-um": 1,
+		     "save-unique": 1,}
+
+	# action functions contains only functions that change something in a router
+	# reason for separation is that we only want to change latest-update if something actually changed
+	action_functions = ("create-user",
+			    "change-passwd",
+			    "add-um",
+			    "update-fw",
+			    "upload-cfg",
+			    "upload-file",
+			    "delete-user",
+			    "sws",
+			    "router-command",
+			    "remove-um",)
+
+	# login functions and the amount of arguments each of them requires
+	login_functions = {"login": 2,
+			   "login-key": 2,
+			   "login-group": 1,}
+
+	# variables that are replaced with router specific values during configuration
+	variables = ("$serial", "$mac", "$model", "$date", "$unique", "($serial)", "($mac)")
+
+	# directives set options of the whole run instead of configuring routers
+	directives = ("update-name", "distribute")
+
+	# functions whose first argument is a local file sent to routers
+	file_functions = ("add-um", "update-fw", "upload-cfg", "upload-file")
+
+	# functions whose files can be distributed through a staging router per site
+	distributed_functions = ("add-um", "update-fw")
+
+	# reads and validates cossh configuration file, raises the same errors as open() if the file can't be read
+	def __init__(self, cfgfile):
+		self.cfgfile = cfgfile
+		self.login = None
+		self.update_value = "Update"
+		self.distribute = None
+		self.errors = []
+		operations = []
+		line_count = 0
+
+		with open(cfgfile) as cf:
+			for unst_line in cf:
+				line_count += 1
+				line = unst_line.strip()
+				col1 = line.split(" ", 1)[0]
+
+				# empty lines and comments are skipped
+				if line == "" or col1.startswith("#"):
+					continue
+
+				if col1 not in self.functions and col1 not in self.login_functions and col1 not in self.directives:
+					self.errors.append("Unknown function '" + col1 + "' on line " + str(line_count))
+					continue
+
+				# reboot is the only function which takes no arguments
+				if col1 == "reboot":
+					if line != "reboot":
+						self.errors.append("Invalid syntax in 'reboot' specification on line " + str(line_count) + " (takes no arguments)")
+					else:
+						operations.append(Operation(col1, (), line_count, ()))
+					continue
+
+				try:
+					# arguments are separated by comma, each function knows the order of its own arguments
+					stripped_line = line.split(" = ", 1)[1].replace(", ", ",").replace(" ,", ",")
+				except IndexError:
+					self.errors.append("Invalid syntax in '" + col1 + "' specification on line " + str(line_count))
+					continue
+
+				# update-name just defines the stamp written into router after changes
+				if col1 == "update-name":
+					self.update_value = stripped_line
+					continue
+
+				# distribute gives the prefix length of a site, files of add-um and update-fw
+				# are uploaded once per site in group logins
+				if col1 == "distribute":
+					if not stripped_line.isdigit() or int(stripped_line) > 32:
+						self.errors.append("Invalid prefix length '" + stripped_line + "' in 'distribute' specification on line " + str(line_count) + " (takes a number between 0 and 32)")
+					else:
+						self.distribute = int(stripped_line)
+					continue
+
+				args = tuple(stripped_line.split(","))
+
+				if col1 in self.login_functions:
+					required = self.login_functions[col1]
+				else:
+					required = self.functions[col1]
+
+				if len(args) < required or "" in args[:required]:
+					self.errors.append("Invalid syntax in '" + col1 + "' specification on line " + str(line_count) + " (takes " + str(required) + " parameters)")
+					continue
+
+				if col1 == "sws" and not "=" in args[0]:
+					self.errors.append("Invalid setting/value pair '" + args[0] + "' on line " + str(line_count))
+					continue
+
+				variables = tuple(var for var in self.variables if any(var in arg for arg in args))
+				operation = Operation(col1, args, line_count, variables)
+
+				# only the first login function is used
+				if col1 in self.login_functions:
+					if self.login == None:
+						self.login = operation
+					continue
+
+				operations.append(operation)
+
+		self.operations = tuple(operations)
+
+	# local files sent to routers by the operations, in the order they are used
+	# only the given functions are included, by default every function which sends a local file
+	def local_files(self, functions=None):
+		if functions == None:
+			functions = self.file_functions
+
+		files = []
+
+		for operation in self.operations:
+			# paths with router specific variables differ between routers
+			if operation.name in functions and len(operation.variables) == 0 and operation.args[0] not in files:
+				files.append(operation.args[0])
+
+		return files
+
+	# local files of the operations which can be distributed
+	def distributed_files(self):
+		return self.local_files(self.distributed_functions)
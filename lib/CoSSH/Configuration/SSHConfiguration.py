@@ -28,57 +28,282 @@ import sys
 import subprocess
 import paramiko
 import os
+import stat
 import openpyxl
 import datetime
 import time
-from CoSSH.Utils.FileWriting import InPlaceReplacement
 from CoSSH.Utils.Hashing import LocalHash
 from CoSSH.Utils.TarBalls import TarBalls
+from CoSSH.Utils.GroupRegistry import GroupRegistry
+from CoSSH.Utils.DigestCache import RemoteDigestCache
+from CoSSH.Utils.Transfer import SFTPTransfer
+from CoSSH.Utils.Timing import TimedOutput
 
 class SSHConfiguration():
 
+        # functions which only run shell commands in router, they can be combined with run_batch()
+        batch_functions = ("create-user",
+                           "change-passwd",
+                           "delete-user",
+                           "sws",
+                           "router-command",
+                           "remove-um",
+                           "latest-update",)
+
+        # printed after each operation's output in combined remote commands
+        step_marker = "@@cossh-step"
+
+        # added to status message when transfer() finds the file already in router
+        identical_note = " (identical file already in router, not transferred)"
+
         # initialize SSH connection
-        def __init__(self, conn, sftp):
+        # sources maps local files to (url, md5) of a copy served in router's site, see Distribution
+        # transfers interrupted by a lost connection are continued this many times, see sftp_put()
+        transfer_attempts = 5
+
+        # digests caches digests of files put in routers, see transfer()
+        # reconnect() returns a new (conn, sftp) pair to the same router, it's used if the connection is lost during a transfer
+        # sftp_channels is the amount of SFTP channels large files are written over at the same time
+        # timing (RouterTiming) records remote commands and SFTP transfers, see CoSSH.Utils.Timing
+        def __init__(self, conn, sftp, registry=None, facts_ttl=0, sources=None, digests=None, reconnect=None, sftp_channels=1, timing=None):
                 self.conn = conn
                 self.sftp = sftp
+                self.router_facts = None
+                self.facts_ttl = facts_ttl
+
+                if sources == None:
+                        sources = {}
+
+                self.sources = sources
+
+                if digests == None:
+                        digests = RemoteDigestCache()
+
+                self.digests = digests
+                self.reconnect = reconnect
+                self.sftp_channels = sftp_channels
+                self.timing = timing
+                self.sent_bytes = 0
+                self.sending_time = 0
+
+                if registry == None:
+                        registry = GroupRegistry()
+
+                self.registry = registry
+
+        # every remote command is run through here, so that it can be timed
+        def exec_command(self, command):
+                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(command)
+
+                if self.timing != None:
+                        ssh_stdout = TimedOutput(ssh_stdout, self.timing)
+
+                return ssh_stdin, ssh_stdout, ssh_stderr
 
         # close SSH connection
         def close_ssh(self):
                 self.conn.close()
                 self.sftp.close()
 
-        # this function writes to router's latest_update.txt
-        def update_name(self, args):
-                func_stat = 2
-                update_stamp = args.split(",", 1)[0]
+        # digest of a file in router, empty if the file doesn't exist
+        def remote_md5(self, remote_path):
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command("openssl md5 " + remote_path + " 2>/dev/null |awk '{print $2}'")
+                return ssh_stdout.read().decode("utf-8", "replace").strip()
+
+        # transfers a local file to router unless an identical file is already in remote_path
+        # returns digest of the file in router after the transfer, and a note for status message
+        #
+        # with use_cache, digests of files put in router are remembered by router's serial number
+        # and a file known to be identical isn't even checked, use it only for files cossh doesn't remove itself
+        def transfer(self, local_path, remote_path, local_md5, use_cache=False):
+                cached_md5 = None
+                serial = None
+
+                if use_cache == True:
+                        serial = self.known_serial()
+
+                if serial != None:
+                        cached_md5 = self.digests.get(serial, remote_path)
+                        if cached_md5 == local_md5:
+                                return local_md5, self.identical_note
+
+                # router is asked only if the cache doesn't already know that the file differs
+                if cached_md5 == None and self.remote_md5(remote_path) == local_md5:
+                        remote_md5 = local_md5
+                        note = self.identical_note
+                else:
+                        if serial != None:
+                                self.digests.forget(serial, remote_path)
 
-                # first check if cossh directory exists under /root
-                check_initial = "ls /root/cossh/"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_initial)
-                check_status = ssh_stdout.channel.recv_exit_status()
+                        note = self.put_file(local_path, remote_path)
+                        remote_md5 = self.remote_md5(remote_path)
 
-                # if the directory doesn't exist, create one
-                if check_status != 0:
-                        create_cossh = "mkdir /root/cossh/"
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(create_cossh)
-                        check_status = ssh_stdout.channel.recv_exit_status()
+                if serial != None and remote_md5 != "":
+                        self.digests.set(serial, remote_path, remote_md5)
 
-                        if check_status != 0:
-                                error_msg = "Failed to create update-stamp"
-                                return error_msg, func_stat
+                return remote_md5, note
 
-                # write update
-                new_stamp = "echo '" + update_stamp + "' > /root/cossh/latest_update.txt"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(new_stamp)
-                check_status = ssh_stdout.channel.recv_exit_status()
+        # serial number of the router if it's known without asking the router (facts already read, or inventory)
+        def known_serial(self):
+                if self.router_facts != None and self.router_facts.get("serial"):
+                        return self.router_facts["serial"]
 
-                if check_status == 0:
-                        status_msg = "Update name: " + update_stamp
-                        func_stat = 0
+                ip_address = self.peer_address()
+                serials = set()
+
+                for group in self.registry.groups_of_ip(ip_address):
+                        serials.update(member.serial for member in self.registry.members(group) if member.ip == ip_address)
+
+                # the same address may belong to different routers in different groups
+                if len(serials) == 1:
+                        return serials.pop()
+
+                return None
+
+        def peer_address(self):
+                return self.conn.get_transport().getpeername()[0]
+
+        # transfers a local file to router, from a copy served in router's site if there is one
+        # downloaded copy is verified, if the download fails the file is uploaded from this host
+        # returns a note telling where the file came from, or how fast it was uploaded
+        def put_file(self, local_path, remote_path):
+                source = self.sources.get(os.path.abspath(local_path))
+
+                if source != None:
+                        url, digest = source
+                        fetch_cmd = "wget -q -T 30 -O " + remote_path + " " + url + " && [ \"$(openssl md5 " + remote_path + " |awk '{print $2}')\" = \"" + digest + "\" ] || { rm -f " + remote_path + "; exit 1; }"
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(fetch_cmd)
+
+                        if ssh_stdout.channel.recv_exit_status() == 0:
+                                return " (from site copy " + url.split("/")[2].split(":")[0] + ")"
+
+                return self.sftp_put(local_path, remote_path)
+
+        # puts a local file to router through a partial file, which is renamed to remote_path when it's complete
+        # if the connection is lost, the transfer is continued from the partial file over a new connection
+        # returns a note with the amount of data sent and achieved transfer rate
+        def sftp_put(self, local_path, remote_path):
+                part_path = remote_path + SFTPTransfer.part_suffix
+                self.sent_bytes = 0
+                self.sending_time = 0
+
+                for attempt in range(1, self.transfer_attempts + 1):
+                        try:
+                                offset = self.put_part(local_path, part_path)
+
+                                # a continued file is checked before it's used, it may have been a part of another file
+                                if offset > 0 and self.remote_md5(part_path) != LocalHash.calculate_md5(local_path):
+                                        self.sftp.remove(part_path)
+                                        offset = self.put_part(local_path, part_path)
+
+                                SFTPTransfer(self.sftp).finish(part_path, remote_path)
+
+                                megabytes = self.sent_bytes / 1048576
+                                rate = megabytes / max(self.sending_time, 0.001)
+                                return " (" + str(round(megabytes, 1)) + " MB sent, " + str(round(rate, 2)) + " MB/s)"
+
+                        # invalid paths and permissions won't be fixed by trying again
+                        except (FileNotFoundError, PermissionError):
+                                raise
+
+                        except (OSError, EOFError, paramiko.SSHException):
+                                if attempt == self.transfer_attempts or self.reconnect == None or self.connected() == True:
+                                        raise
+
+                                try:
+                                        self.close_ssh()
+                                except Exception:
+                                        pass
+
+                                self.conn, self.sftp = self.reconnect()
+
+        # pooled sessions (cossh-pool) write file data in cossh-pool, which holds the connection
+        # sent_bytes and sending_time count completed writes, they give the transfer rate
+        def put_part(self, local_path, part_path):
+                started = time.time()
+
+                if isinstance(self.sftp, paramiko.SFTPClient):
+                        offset = SFTPTransfer(self.sftp, self.sftp_channels).put_part(local_path, part_path)
                 else:
-                        status_msg = "Failed to create update-stamp"
+                        offset = self.sftp.put_part(local_path, part_path, self.sftp_channels)
 
-                return status_msg, func_stat
+                self.sent_bytes += os.path.getsize(local_path) - offset
+                self.sending_time += time.time() - started
+
+                if self.timing != None:
+                        self.timing.record("sftp-put", started, os.path.getsize(local_path) - offset)
+
+                return offset
+
+        def connected(self):
+                try:
+                        transport = self.conn.get_transport()
+                        return transport != None and transport.is_active()
+                except Exception:
+                        return False
+
+        # runs a script returned by one of the *_script functions with a single remote command
+        # the script's exit status and output are turned into status message and function status by results()
+        def run_script(self, script, results):
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(script)
+                cmd_output = ssh_stdout.read().decode("utf-8", "replace")
+                cmd_status = ssh_stdout.channel.recv_exit_status()
+
+                return results(cmd_status, cmd_output)
+
+        # runs several operations with a single remote command, operations is a list of (function name, args)
+        # only functions in batch_functions can be combined, each of them runs in its own subshell and
+        # its exit status is printed after its output, so every operation gets its own result
+        def run_batch(self, operations):
+                scripts = []
+                step_results = []
+
+                for function, args in operations:
+                        try:
+                                scripts.append(getattr(self, function + "_script")(args))
+                        except Exception as e:
+                                scripts.append((None, str(e)))
+
+                # subshells are separated by newlines, so comments and trailing ampersands in commands stay harmless
+                batch_cmd = "\n".join("(\n" + script + "\n)\nprintf '\\n" + self.step_marker + " %d@@\\n' $?" for script, results in scripts if script != None)
+                batch_output = ""
+
+                if batch_cmd != "":
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(batch_cmd)
+                        batch_output = ssh_stdout.read().decode("utf-8", "replace")
+                        ssh_stdout.channel.recv_exit_status()
+
+                # output is split to [output, exit status, output, exit status, ..., remaining output]
+                steps = re.split("\n" + self.step_marker + " (\\d+)@@\n", batch_output)
+                step = 0
+
+                for script, results in scripts:
+                        if script == None:
+                                step_results.append((results, 2))
+                        elif step * 2 + 1 < len(steps):
+                                step_results.append(results(int(steps[step * 2 + 1]), steps[step * 2]))
+                                step += 1
+                        else:
+                                step_results.append(("No result, connection to router was lost", 2))
+
+                return step_results
+
+        # this function writes to router's latest_update.txt
+        def update_name(self, args):
+                return self.run_script(*self.update_name_script(args))
+
+        def update_name_script(self, args):
+                update_stamp = args.split(",", 1)[0]
+
+                # create cossh directory under /root if it doesn't exist and write update
+                script = "mkdir -p /root/cossh/ && echo '" + update_stamp + "' > /root/cossh/latest_update.txt"
+
+                def results(cmd_status, cmd_output):
+                        if cmd_status == 0:
+                                return "Update name: " + update_stamp, 0
+                        return "Failed to create update-stamp", 2
+
+                return script, results
 
 
         # gets a unique configuration file from router and places it locally under /etc/cossh/configs/
@@ -95,7 +320,7 @@ class SSHConfiguration():
                 local_path = "/etc/cossh/configs/cossh_" + str(serial) + ".cfg"
                 create_unique = "backup > " + remote_path
                 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(create_unique)
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(create_unique)
                 check_status = ssh_stdout.channel.recv_exit_status()
 
                 if check_status != 0:
@@ -105,14 +330,18 @@ class SSHConfiguration():
                 remote_md5_cmd = "openssl md5 " + remote_path + " |awk '{print $2}'"
                 remove_remote = "rm -f " + remote_path
 
+                started = time.time()
                 self.sftp.get(remote_path, local_path)
 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remote_md5_cmd)
+                if self.timing != None:
+                        self.timing.record("sftp-get", started, os.path.getsize(local_path))
+
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(remote_md5_cmd)
                 cmd_output = ssh_stdout.readlines()
                 remote_md5 = cmd_output[0].strip()
                 local_md5 = LocalHash.calculate_md5(local_path)
 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remove_remote)
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(remove_remote)
                 cmd_output = ssh_stdout.readlines()
 
                 if local_md5 != remote_md5:
@@ -126,20 +355,18 @@ class SSHConfiguration():
 
         # this function reads latest update and prints it
         def latest_update(self, args):
-                func_stat = 1
-                check_updatefile = "cat /root/cossh/latest_update.txt"
+                return self.run_script(*self.latest_update_script(args))
 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_updatefile)
-                check_status = ssh_stdout.channel.recv_exit_status()
+        def latest_update_script(self, args):
+                script = "cat /root/cossh/latest_update.txt"
 
-                if check_status != 0:
-                        status_msg = "No prior updates found"
-                else:
-                        status_msg = ssh_stdout.readlines()
-                        status_msg = "Latest update: " + status_msg[0].strip()
-                        func_stat = 0
+                def results(cmd_status, cmd_output):
+                        lines = cmd_output.splitlines()
+                        if cmd_status != 0 or len(lines) == 0:
+                                return "No prior updates found", 1
+                        return "Latest update: " + lines[0].strip(), 0
 
-                return status_msg, func_stat
+                return script, results
 
         # this function adds a new client to a group (for group configuration)
         def add_client(self, args):
@@ -155,39 +382,10 @@ class SSHConfiguration():
                 if not os.path.exists(client_conf):
                         open(client_conf, 'a').close()
 
-                # read current client.conf
-                with open(client_conf) as clcf:
-                        content = list(map(str.strip,clcf.readlines()))
-
-                        # check if client is already in a group
-                        # a client can only be in one group at a time
-                        if any(serial in s for s in content):
-                                status_msg = "Client '" + serial + "' is already in a group"
-                                func_stat = 1
-                                return status_msg, func_stat
-
-                        client_bool = False
-
-                        # find the group the client will join
-                        for line in content:
-                                if line.strip().startswith("@@") and line.strip().endswith("@@"):
-                                        if line.strip() == "@@" + client_group + "@@":
-                                                client_bool = True
-                                        else:
-                                                client_bool = False
-
-                                # check if new client's IPv4 address is already occupied in the group
-                                if client_bool == True and not line.strip().startswith("@@") and line.strip() != "":
-                                        client_ip = line.strip().split(":", 1)[0]
-                                        if client_name == client_ip:
-                                                status_msg = "Client IP '" + client_name + "' already belongs to the group"
-                                                return status_msg, func_stat
-
-                        # if group doesn't exist, mark it as a new group
-                        if not "@@" + client_group + "@@" in content:
-                                new_group = True
-                        else:
-                                new_group = False
+                # check if client can join the group before asking anything
+                status_msg, func_stat = self.check_client(serial, client_name, client_group)
+                if func_stat != 0:
+                        return status_msg, func_stat
 
                 # check if groups SSH keys exist
                 if not os.path.exists(private_key_file) and not os.path.exists(public_key_file):
@@ -215,30 +413,23 @@ class SSHConfiguration():
                         create_keys = 'ssh-keygen -b 2048 -t rsa -f /etc/cossh/keys/cossh-key_' + client_group + ' -q -N "' + key_passwd + '"'
                         subprocess.call([create_keys], shell=True)
 
-                # if it's a new group, add group and its first client
-                if new_group == True:
-                        with open(client_conf, "a") as clcf:
-                                clcf.write("\n@@" + client_group + "@@\n")
-                                clcf.write(client_name + ":" + str(serial) + "\n")
-
-                # if group exists, add client
-                else:
-                        #add_client = "sed -i '/@@" + client_group + "@@/a " + client_name + ":" + str(serial) + " ' " + client_conf
-                        #subprocess.call([add_client], shell=True)
-                        InPlaceReplacement.after_string("@@" + client_group + "@@", client_name + ":" + str(serial), client_conf)
-
+                # checks are repeated while the client is added, in case another process
+                # changed the groups in the meantime
+                if not self.registry.add_client(client_group, client_name, str(serial)):
+                        status_msg, func_stat = self.check_client(serial, client_name, client_group)
+                        return status_msg, func_stat
 
                 with open(public_key_file) as pubk:
                         public_key = pubk.read().replace("\n", "")
 
                 # check if .ssh dir exists in router
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_ssh_dir)
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(check_ssh_dir)
                 check_status = ssh_stdout.channel.recv_exit_status()
 
                 # if the directory doesn't exist, create one
                 if check_status != 0:
                         create_ssh_dir = "mkdir /root/.ssh"
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(create_ssh_dir)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(create_ssh_dir)
                         dir_status = ssh_stdout.channel.recv_exit_status()
 
                 # add public key to router's authorized keys and create a copy under /opt directory
@@ -248,11 +439,11 @@ class SSHConfiguration():
                         add_public_key = "echo " + public_key + " >> /root/.ssh/authorized_keys"
                         copy_key = "cp -r /root/.ssh /opt/"
                         add_startup_check = 'echo "if [ ! -d /root/.ssh/ ]; then cp -r /opt/.ssh/ /root/;fi" >> /etc/rc.local'
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(add_public_key)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(add_public_key)
                         key_status = ssh_stdout.channel.recv_exit_status()
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(copy_key)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(copy_key)
                         copy_status = ssh_stdout.channel.recv_exit_status()
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(add_startup_check)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(add_startup_check)
                         startup_status = ssh_stdout.channel.recv_exit_status()
 
                         if key_status == 0 and copy_status == 0 and startup_status == 0:
@@ -269,23 +460,40 @@ class SSHConfiguration():
                         func_stat = 2
 
                 return status_msg, func_stat
+
+        # checks if a client can be added to a group, func_stat is 0 if it can
+        def check_client(self, serial, client_name, client_group):
+                func_stat = 2
+
+                # check if client is already in a group
+                # a client can only be in one group at a time
+                if self.registry.group_of_serial(serial) != None:
+                        status_msg = "Client '" + serial + "' is already in a group"
+                        func_stat = 1
+                        return status_msg, func_stat
+
+                # check if new client's IPv4 address is already occupied in the group
+                if self.registry.in_group(client_name, client_group):
+                        status_msg = "Client IP '" + client_name + "' already belongs to the group"
+                        return status_msg, func_stat
+
+                func_stat = 0
+                return "", func_stat
                 
 
         # run a custom command in router
         def router_command(self, args):
-                func_stat = 2
-                user_command = args.split(",", 1)[0]
+                return self.run_script(*self.router_command_script(args))
 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(user_command)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
+        def router_command_script(self, args):
+                user_command = args.split(",", 1)[0]
 
-                if cmd_status == 0:
-                        func_stat = 0
-                        status_msg = "Command '" + user_command + "' ran succesfully"
-                else:
-                        status_msg = "Command '"+ user_command + "' returned exit status " + str(cmd_status)
+                def results(cmd_status, cmd_output):
+                        if cmd_status == 0:
+                                return "Command '" + user_command + "' ran succesfully", 0
+                        return "Command '"+ user_command + "' returned exit status " + str(cmd_status), 2
 
-                return status_msg, func_stat
+                return user_command, results
         
         #write value to excel file, writes into first empty cell under specified column 
         def write_excel(self, args):
@@ -341,142 +549,226 @@ class SSHConfiguration():
 
                 return status_msg, func_stat
 
-        # gets router's model
-        def get_model(self):
-                cmd = "status -v sys |grep \"Product Name\" |awk '{print $4}'"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                outp = ssh_stdout.readlines()
-                model = outp[0].strip()
+        # router facts and where they are found, fact: (section, grep pattern, awk field)
+        # sections are outputs of the commands in facts_cmd, in the same order
+        fact_sources = {"model": (0, "Product Name", 4),
+                        "type": (0, "Product Type", 4),
+                        "serial": (0, "Serial Number", 4),
+                        "imei": (1, "IMEI", 3),
+                        "iccid": (1, "ICCID", 3),
+                        "mac": (2, "HWaddr", 5),}
+
+        fact_section = "@@cossh@@"
+        facts_cmd = "status -v sys; echo '" + fact_section + "'; status -v module; echo '" + fact_section + "'; ifconfig eth0"
+
+        # product names that are shown with their marketing names
+        model_names = {"SPECTRE-v3-LTE": "SmartFlex",
+                       "SPECTRE-v3T-LTE": "SmartMotion",
+                       "SPECTRE-v3L-LTE": "SmartStart",}
+
+        # collects every router fact with a single remote command the first time a fact is needed
+        # facts are kept in memory for the rest of the session, and stored in the inventory keyed by IPv4 address
+        # if facts_ttl is set, facts stored in the inventory during the last facts_ttl seconds are used instead
+        def facts(self):
+                if self.router_facts != None:
+                        return self.router_facts
+
+                ip_address = self.peer_address()
+
+                if self.facts_ttl > 0:
+                        stored_facts = self.registry.get_facts(ip_address, self.facts_ttl)
+                        if all(name in stored_facts for name in self.fact_sources):
+                                self.router_facts = stored_facts
+                                return self.router_facts
+
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(self.facts_cmd)
+                self.router_facts = self.parse_facts(ssh_stdout.read().decode("utf-8", "replace"))
+                self.registry.set_facts(ip_address, self.router_facts)
+
+                return self.router_facts
+
+        # picks facts from the output of facts_cmd, like grep <pattern> |awk '{print $<field>}' would
+        def parse_facts(self, output, names=None):
+                sections = [section.splitlines() for section in output.split(self.fact_section)]
+                parsed_facts = {}
+
+                if names == None:
+                        names = self.fact_sources
+
+                for name in names:
+                        section, pattern, field = self.fact_sources[name]
+                        if section >= len(sections):
+                                continue
+
+                        for line in sections[section]:
+                                if pattern in line:
+                                        fields = line.split()
+                                        if len(fields) >= field:
+                                                parsed_facts[name] = fields[field - 1]
+                                        else:
+                                                parsed_facts[name] = ""
+                                        break
 
-                if model == "SPECTRE-v3-LTE":
-                        model = "SmartFlex"
-                elif model == "SPECTRE-v3T-LTE":
-                        model = "SmartMotion"
-                elif model == "SPECTRE-v3L-LTE":
-                        model = "SmartStart"
+                return parsed_facts
 
-                return model
+        def get_fact(self, name):
+                value = self.facts().get(name)
 
-        def get_type(self):
-                cmd = "status -v sys |grep \"Product Type\" |awk '{print $4}'"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                outp = ssh_stdout.readlines()
-                model = outp[0].strip()
+                if value == None:
+                        raise ValueError("Couldn't read router's " + name)
 
-                if model == "SPECTRE-v3-LTE":
-                    model = "SmartFlex"
-                elif model == "SPECTRE-v3T-LTE":
-                    model = "SmartMotion"
-                elif model == "SPECTRE-v3L-LTE":
-                    model = "SmartStart"
+                return value
 
-                return model
+        # gets router's model
+        def get_model(self):
+                model = self.get_fact("model")
+                return self.model_names.get(model, model)
+
+        def get_type(self):
+                model = self.get_fact("type")
+                return self.model_names.get(model, model)
 
         def get_imei(self):
-                cmd = "status -v module |grep \"IMEI\" |awk '{print $3}'"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                outp = ssh_stdout.readlines()
-                imei = outp[0].strip()
-                return imei
+                return self.get_fact("imei")
 
+        # ICCID may not be available right after boot, so only the module's status is read again
         def get_iccid(self, attempts=1, delay=5):
-                cmd = "status -v module |grep \"ICCID\" |awk '{print $3}'"
-                for i in range(attempts):
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                        outp = ssh_stdout.readlines()
-                        iccid = outp[0].strip()
+                iccid = self.get_fact("iccid")
 
+                for i in range(1, attempts):
                         if iccid != "N/A":
                                 break
-                        else:
-                                time.sleep(delay)
+
+                        time.sleep(delay)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command("echo '" + self.fact_section + "'; status -v module")
+                        module_facts = self.parse_facts(ssh_stdout.read().decode("utf-8", "replace"), ["imei", "iccid"])
+                        self.router_facts.update(module_facts)
+                        iccid = self.get_fact("iccid")
 
                 return iccid
 
         # gets router's serial number
         def get_serial(self):
-                cmd = "status -v sys |grep \"Serial Number\" |awk '{print $4}'"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                outp = ssh_stdout.readlines()
-                serial = outp[0].strip()
-                return serial
+                return self.get_fact("serial")
 
         # gets router's primary mac address
         def get_mac(self):
-                cmd = "ifconfig eth0 |grep \"HWaddr\" |awk '{print $5}'"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                outp = ssh_stdout.readlines()
-                mac = outp[0].strip()
-                return mac
+                return self.get_fact("mac")
+
+        # updates router's configuration parameters, those parameters are in /etc/settings* files
+        # args holds one or more KEY=value pairs separated by comma, a part without '=' belongs to the previous value
+        config_key = re.compile("^[A-Za-z0-9_]+$")
 
-        # updates router's single configuration parameter, those parameters are in /etc/settings* files
         def sws(self, args):
-                func_stat = 2
-                param = args.split("=", 1)[0] + "="
-                val = args.split("=", 2)[1]
-                get_remote_file = "for i in /etc/settings.*;do grep -l '" + param  + "' $i;done"
-                try:
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(get_remote_file)
-                        cmd_output = ssh_stdout.readlines()
-                        remote_file = cmd_output[0].strip()
-                except IndexError:
-                        error_msg = "Invalid parameter '" + param + "'"
-                        return error_msg, func_stat
-                except Exception as e:
-                        return e, func_stat
-
-                if val == "$mac":
-                        val = self.get_mac()
-                elif val == "$serial":
-                        val = self.get_serial()
-                elif val == "$model":
-                        val = self.get_model()
-
-                #change_val = "sed -i 's/" + param + ".*/" + param + val + "/' " + remote_file
-                change_val = "sed -i 's|" + param + ".*|" + param + val + "|' " + remote_file
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(change_val)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
+                return self.run_script(*self.sws_script(args))
 
-                if cmd_status == 0:
-                        status_msg = "Parameter '" + param + "' succesfully changed to '" + val + "'"
-                        func_stat = 0
+        def sws_script(self, args):
+                pairs = []
+
+                for part in args.split(","):
+                        if "=" in part or len(pairs) == 0:
+                                pairs.append(part.split("=", 1) + [""])
+                        else:
+                                pairs[-1][1] += "," + part
+
+                return self.sws_pairs_script([(pair[0], pair[1]) for pair in pairs])
+
+        # printed by sws script before a settings file that couldn't be edited
+        sws_failed = "@@sws-failed@@:"
+
+        # changes every (parameter, value) pair with a single remote command
+        # one grep over the settings files finds the file of each parameter, then each file is edited with one sed
+        def sws_pairs_script(self, pairs):
+                params = []
+                values = {}
+                expressions = []
+
+                for key, val in pairs:
+                        if val == "$mac":
+                                val = self.get_mac()
+                        elif val == "$serial":
+                                val = self.get_serial()
+                        elif val == "$model":
+                                val = self.get_model()
+
+                        if key not in values:
+                                params.append(key)
+                        values[key] = val
+
+                # parameters are used in regular expressions, only names settings files can have are accepted
+                valid = [key for key in params if self.config_key.match(key)]
+
+                for key in valid:
+                        # parameter must start the line, otherwise FOO= would also match BAR_FOO=
+                        replacement = values[key].replace("\\", "\\\\").replace("&", "\\&").replace("|", "\\|")
+                        expressions.append("-e 's|^" + key + "=.*|" + key + "=" + replacement.replace("'", "'\\''") + "|'")
+
+                if len(valid) > 0:
+                        # index lines are <settings file>:<parameter>= (-H, also with a single settings file)
+                        # files are edited only if they have some of the parameters, a file sed fails with is printed
+                        script = "index=$(grep -H -o -E '^(" + "|".join(valid) + ")=' /etc/settings.* 2>/dev/null); echo \"$index\"; status=0; " + \
+                                 "for remote_file in $(echo \"$index\" |cut -d: -f1 |uniq); do sed -i " + " ".join(expressions) + " $remote_file || " + \
+                                 "{ echo \"" + self.sws_failed + "$remote_file\"; status=11; }; done; exit $status"
                 else:
-                        status_msg = "Failed to change parameter '" + param + "'  to '" + val + "'"
+                        script = "true"
+
+                def results(cmd_status, cmd_output):
+                        files = {}
+                        failed_files = set()
+
+                        for line in cmd_output.splitlines():
+                                if line.startswith(self.sws_failed):
+                                        failed_files.add(line[len(self.sws_failed):])
+                                elif line.endswith("=") and ":" in line:
+                                        remote_file, param = line.split(":", 1)
+                                        files.setdefault(param[:-1], set()).add(remote_file)
+
+                        messages = []
+                        status = 0
+
+                        for key in params:
+                                param = key + "="
+
+                                if key not in files:
+                                        messages.append("Invalid parameter '" + param + "'")
+                                        status = 2
+                                elif cmd_status in (0, 11) and len(files[key] & failed_files) == 0:
+                                        messages.append("Parameter '" + param + "' succesfully changed to '" + values[key] + "'")
+                                else:
+                                        messages.append("Failed to change parameter '" + param + "'  to '" + values[key] + "'")
+                                        status = 2
 
-                return status_msg, func_stat
+                        return "; ".join(messages), status
+
+                return script, results
 
         # deletes given user
         def delete_user(self, args):
-                func_stat = 2
-                username = args.split(",", 1)[0]
-                del_cmd = "deluser " + username
+                return self.run_script(*self.delete_user_script(args))
 
-                check_user = "id -u " + username
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_user)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
-                if cmd_status != 0:
-                        error_msg = "User '" + username + "' doesn't exist"
-                        func_stat = 1
-                        return error_msg, func_stat
+        def delete_user_script(self, args):
+                username = args.split(",", 1)[0]
+                script = "id -u " + username + " >/dev/null 2>&1 || exit 10; deluser " + username
 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(del_cmd)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
+                def results(cmd_status, cmd_output):
+                        if cmd_status == 0:
+                                return "User '" + username + "' deleted", 0
+                        elif cmd_status == 10:
+                                return "User '" + username + "' doesn't exist", 1
+                        return "Failed to delete user '" + username + "'", 2
 
-                if cmd_status == 0:
-                        status_msg = "User '" + username + "' deleted"
-                        func_stat = 0
-                else:
-                        status_msg = "Failed to delete user '" + username + "'"
-                return status_msg, func_stat
+                return script, results
 
         # reboots router
         def reboot(self):
                 cmd = "reboot"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(cmd)
 
         # this function creates a new user, which can be administrator or regular user
         def create_user(self, args):
-                func_stat = 2
+                return self.run_script(*self.create_user_script(args))
+
+        def create_user_script(self, args):
                 username = args.split(",", 1)[0]
                 password = args.split(",", 2)[1]
                 admin = args.split(",", 3)[2]
@@ -489,42 +781,31 @@ class SSHConfiguration():
                         mac = self.get_mac()
                         password = password.replace("($mac)", mac)
 
-                # check if user already exists
-                check_user = "id -u " + username
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_user)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
-                if cmd_status == 0:
-                        error_msg = "User '" + username + "' already exists"
-                        func_stat = 1
-                        return error_msg, func_stat
-
                 # check if new user will be regular user or admin and create new user accordingly
                 if admin == "admin":
-                        cmd = "adduser -D -S " + username + " -G root"
+                        add_user = "adduser -D -S " + username + " -G root"
                 else:
-                        cmd = "adduser -D " + username + " " + username
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
+                        add_user = "adduser -D " + username + " " + username
 
-                # if user was successfully created, set password for the new user
-                if cmd_status == 0:
-                        cmd = "echo " + "'" + username + ":" + password + "' |chpasswd -m"
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                        cmd_status = ssh_stdout.channel.recv_exit_status()
+                # check if user already exists, create the user and set password for the new user
+                script = "id -u " + username + " >/dev/null 2>&1 && exit 10; " + add_user + " || exit 11; echo " + "'" + username + ":" + password + "' |chpasswd -m || exit 12"
+
+                def results(cmd_status, cmd_output):
                         if cmd_status == 0:
-                                status_msg = "New user '" + username + "' created"
-                                func_stat = 0
-                        else:
-                                status_msg = "New user '" + username + "' was created, but password remains blank"
-                                func_stat = 1
-                else:
-                        status_msg = "Couldn't create new user " + username
+                                return "New user '" + username + "' created", 0
+                        elif cmd_status == 10:
+                                return "User '" + username + "' already exists", 1
+                        elif cmd_status == 12:
+                                return "New user '" + username + "' was created, but password remains blank", 1
+                        return "Couldn't create new user " + username, 2
 
-                return status_msg, func_stat
+                return script, results
 
         # this function changes password of given user
         def change_passwd(self, args):
-                func_stat = 2
+                return self.run_script(*self.change_passwd_script(args))
+
+        def change_passwd_script(self, args):
                 username = args.split(",", 1)[0]
                 password = args.split(",", 2)[1]
 
@@ -536,53 +817,36 @@ class SSHConfiguration():
                         mac = self.get_mac()
                         password = password.replace("($mac)", mac)
 
-                # check if given user exists
-                check_user = "id -u " + username
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_user)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
-                if cmd_status != 0:
-                        error_msg = "Can't change password, user '" + username + "' does not exist"
-                        func_stat = 1
-                        return error_msg, func_stat
+                # check if given user exists and change password for given user
+                script = "id -u " + username + " >/dev/null 2>&1 || exit 10; echo " + "'" + username + ":" + password + "' |chpasswd -m"
 
-                # change password for given user
-                cmd = "echo " + "'" + username + ":" + password + "' |chpasswd -m"
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(cmd)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
-                if cmd_status == 0:
-                        status_msg = "Password for user '" + username + "' succesfully changed"
-                        func_stat = 0
-                else:
-                        status_msg = "Failed to change password for user '" + username + "'"
+                def results(cmd_status, cmd_output):
+                        if cmd_status == 0:
+                                return "Password for user '" + username + "' succesfully changed", 0
+                        elif cmd_status == 10:
+                                return "Can't change password, user '" + username + "' does not exist", 1
+                        return "Failed to change password for user '" + username + "'", 2
 
-                return status_msg, func_stat
+                return script, results
 
         def remove_um(self, args):
-                func_stat = 2
+                return self.run_script(*self.remove_um_script(args))
+
+        def remove_um_script(self, args):
                 um_name = args.split(",", 1)[0]
                 um_path = "/opt/" + um_name
 
-                # check if given user module exists in router
-                check_um_path = "ls " + um_path
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_um_path)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
+                # check if given user module exists in router and remove it
+                script = "ls " + um_path + " >/dev/null 2>&1 || exit 10; rm -rf " + um_path
 
-                if cmd_status != 0:
-                        error_msg = "User module '" + um_name + "' doesn't exist... double check user module's name"
-                        return error_msg, func_stat
+                def results(cmd_status, cmd_output):
+                        if cmd_status == 0:
+                                return "User module '" + um_name + "' successfully removed from router", 0
+                        elif cmd_status == 10:
+                                return "User module '" + um_name + "' doesn't exist... double check user module's name", 2
+                        return "Failed to remove user module '" + um_name + "'", 2
 
-                # remove user module from router
-                rm_um = "rm -rf " + um_path
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(rm_um)
-                cmd_status = ssh_stdout.channel.recv_exit_status()
-
-                if cmd_status !=0:
-                        error_msg = "Failed to remove user module '" + um_name + "'"
-                        return error_msg, func_stat
-                else:
-                        status_msg = "User module '" + um_name + "' successfully removed from router"
-                        func_stat = 0
-                        return status_msg, func_stat
+                return script, results
 
         def update_fw(self, args):
                 func_stat = 2
@@ -599,26 +863,21 @@ class SSHConfiguration():
                 local_md5 = LocalHash.calculate_md5(path_to_fw)
 
                 remote_path = "/tmp/" + os.path.basename(path_to_fw)
-                remote_md5_cmd = "openssl md5 " + remote_path + " |awk '{print $2}'"
                 rm_remote_fw = "rm " + remote_path
                 install_cmd = "fwupdate -i " + remote_path + " -n"
 
-                self.sftp.put(path_to_fw, remote_path)
-
-                # store remote fw's md5sum
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remote_md5_cmd)
-                cmd_output = ssh_stdout.readlines()
-                remote_md5 = cmd_output[0].strip()
+                # firmware left in router by an earlier, interrupted update isn't transferred again
+                remote_md5, source_note = self.transfer(path_to_fw, remote_path, local_md5)
 
                 # if md5sums match = fw was transferred successfully
                 if local_md5 == remote_md5:
 
                     # install fw in router
-                    ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(install_cmd)
+                    ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(install_cmd)
                     cmd_status = ssh_stdout.channel.recv_exit_status()
                     if cmd_status == 0:
-                        self.conn.exec_command(rm_remote_fw)
-                        status_msg = "Firmware " + fw_name + " succesfully installed!"
+                        self.exec_command(rm_remote_fw)
+                        status_msg = "Firmware " + fw_name + " succesfully installed!" + source_note
                         func_stat = 0
                     else:
                         status_msg = "Firmware " + fw_name + " transferred to router, but failed to install"
@@ -654,29 +913,24 @@ class SSHConfiguration():
                 local_md5 = LocalHash.calculate_md5(path_to_um)
 
                 remote_path = "/opt/" + os.path.basename(path_to_um)
-                remote_md5_cmd = "openssl md5 " + remote_path + " |awk '{print $2}'"
                 rm_remote_tar = "rm " + remote_path
 
                 init_set = "cp /opt/" + um_name + "/etc/defaults /opt/" + um_name + "/etc/settings"
                 extract_cmd = "tar -xzf " + remote_path + " -C /opt/"
 
-                self.sftp.put(path_to_um, remote_path)
-
-                # store remote user module's md5sum
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remote_md5_cmd)
-                cmd_output = ssh_stdout.readlines()
-                remote_md5 = cmd_output[0].strip()
+                # user module left in router by an earlier, interrupted installation isn't transferred again
+                remote_md5, source_note = self.transfer(path_to_um, remote_path, local_md5)
 
                 # if md5sums match = user module was transferred successfully
                 if local_md5 == remote_md5:
 
                         # extract and install user module in router
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(extract_cmd)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(extract_cmd)
                         cmd_status = ssh_stdout.channel.recv_exit_status()
                         if cmd_status == 0:
-                                self.conn.exec_command(init_set)
-                                self.conn.exec_command(rm_remote_tar)
-                                status_msg = "User module " + um_name + " succesfully installed to router!"
+                                self.exec_command(init_set)
+                                self.exec_command(rm_remote_tar)
+                                status_msg = "User module " + um_name + " succesfully installed to router!" + source_note
                                 func_stat = 0
                         else:
                                 status_msg = "User module " + um_name + " transferred to router, but failed to install"
@@ -695,11 +949,21 @@ class SSHConfiguration():
                 profile = args.split(",", 2)[1]
                 profiles = ["standard", "alt1", "alt2", "alt3"]
 
+                # optional third argument 'delta' applies only the changed parameters, see upload_cfg_delta()
+                if len(args.split(",")) > 2:
+                        mode = args.split(",")[2]
+                else:
+                        mode = "full"
+
                 # check profile validity
                 if profile not in profiles:
                         error_msg = "Invalid profile '" + profile +"'"
                         return error_msg, func_stat
 
+                if mode not in ("full", "delta"):
+                        error_msg = "Invalid upload mode '" + mode + "', use 'delta' or leave it out"
+                        return error_msg, func_stat
+
                 # if $unique is given as a path, program will look for router's unique config template
                 # under /etc/cossh/configs, and use it if found
                 if path_to_cfg == "$unique":
@@ -717,6 +981,11 @@ class SSHConfiguration():
                         error_msg = "Missing unique configuration file '" + path_to_cfg + "'"
                         return error_msg, func_stat
 
+                if mode == "delta" and profile == "standard":
+                        delta_result = self.upload_cfg_delta(path_to_cfg)
+                        if delta_result != None:
+                                return delta_result
+
                 # store local configuration file's md5sum
                 local_md5 = LocalHash.calculate_md5(path_to_cfg)
 
@@ -724,10 +993,14 @@ class SSHConfiguration():
                 remote_md5_cmd = "openssl md5 " + remote_path + " |awk '{print $2}'"
                 restore_cfg = "restore " + remote_path
 
+                started = time.time()
                 self.sftp.put(path_to_cfg, remote_path)
 
+                if self.timing != None:
+                        self.timing.record("sftp-put", started, os.path.getsize(path_to_cfg))
+
                 # store remote configuration file's md5sum
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remote_md5_cmd)
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(remote_md5_cmd)
                 cmd_output = ssh_stdout.readlines()
                 remote_md5 = cmd_output[0].strip()
 
@@ -738,7 +1011,7 @@ class SSHConfiguration():
                         # if PROFILE= exists, override it
                         # else insert PROFILE in the first line
                         check_prof = "grep -q 'PROFILE=' " + remote_path
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_prof)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(check_prof)
                         check_status = ssh_stdout.channel.recv_exit_status()
                         if check_status == 0:
                                 if profile == "standard":
@@ -751,28 +1024,28 @@ class SSHConfiguration():
                                 else:
                                         add_profile = "sed -i '1 i\PROFILE=" + profile + "' " + remote_path
 
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(add_profile)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(add_profile)
                         cmd_status = ssh_stdout.channel.recv_exit_status()
 
                         # check if device has ssh keys installed
                         # if it does, include ssh keys check in startup script
                         # new startup script wipes off old
                         check_ssh_dir = "ls -l /opt/.ssh/"
-                        ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_ssh_dir)
+                        ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(check_ssh_dir)
                         ssh_check_status = ssh_stdout.channel.recv_exit_status()
 
                         if ssh_check_status == 0:
                                 add_ssh_startup = "echo 'STARTUP=if [ ! -d /root/.ssh/ ]; then cp -r /opt/.ssh/ /root/;fi' >> " + remote_path
-                                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(check_ssh_dir)
+                                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(check_ssh_dir)
                                 startup_add_status = ssh_stdout.channel.recv_exit_status()
 
                         # restore configuration
                         if cmd_status == 0:
-                                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(restore_cfg)
+                                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(restore_cfg)
                                 cmd_status = ssh_stdout.channel.recv_exit_status()
                                 cmd_output = ssh_stdout.readlines()
                                 remove_file = "rm -f " + remote_path
-                                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remove_file)
+                                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command(remove_file)
                                 if cmd_status == 0:
                                         status_msg = "Configuration file " + os.path.basename(path_to_cfg)  + " uploaded to " + profile
                                         func_stat = 0
@@ -790,6 +1063,79 @@ class SSHConfiguration():
                 return status_msg, func_stat
         
 
+        # configuration lines are KEY=value, like in the output of router's backup command
+        config_line = re.compile("^([A-Z0-9_]+)=(.*)$")
+
+        # keys which are not settings of the profile, they are handled by full restore only
+        config_meta_keys = ("PROFILE",)
+
+        # parses configuration into an ordered list of (key, value), returns None if a line isn't KEY=value
+        def parse_config(self, config):
+                settings = []
+
+                for line in config.splitlines():
+                        if line.strip() == "" or line.startswith("#"):
+                                continue
+
+                        match = self.config_line.match(line)
+                        if match == None:
+                                return None
+
+                        settings.append((match.group(1), match.group(2)))
+
+                return settings
+
+        # compares a configuration file with router's current configuration (backup), and changes
+        # only the parameters which differ, with one remote command
+        # returns None if the configuration can't be applied this way, and full restore should be used instead
+        def upload_cfg_delta(self, path_to_cfg):
+                cfg_name = os.path.basename(path_to_cfg)
+
+                with open(path_to_cfg) as cfg_file:
+                        target = self.parse_config(cfg_file.read())
+
+                ssh_stdin, ssh_stdout, ssh_stderr = self.exec_command("backup")
+                backup_output = ssh_stdout.read().decode("utf-8", "replace")
+
+                if ssh_stdout.channel.recv_exit_status() != 0 or target == None:
+                        return None
+
+                current = self.parse_config(backup_output)
+                if current == None:
+                        return None
+
+                current = dict(current)
+
+                # settings files (and sws) hold the standard profile, they can't be used while another profile is active
+                if current.get("PROFILE", "") != "":
+                        return None
+
+                # full restore drops parameters missing from the file, delta would leave them in router
+                target_keys = set(key for key, value in target)
+                if any(key not in target_keys and key not in self.config_meta_keys for key in current):
+                        return None
+
+                changes = [(key, value) for key, value in target if key not in self.config_meta_keys and current.get(key) != value]
+
+                if len(changes) == 0:
+                        return "No changes to configuration, configuration remains unchanged", 1
+
+                # new parameters need full restore
+                if any(key not in current for key, value in changes):
+                        return None
+
+                if self.run_script(*self.sws_pairs_script(changes))[1] != 0:
+                        return None
+
+                return "Configuration file " + cfg_name + " applied to standard, " + str(len(changes)) + " changed parameters (" + ", ".join(key for key, value in changes) + ")", 0
+
+        # True if remote_path is an existing directory in router
+        def remote_isdir(self, remote_path):
+                try:
+                        return stat.S_ISDIR(self.sftp.stat(remote_path).st_mode)
+                except IOError:
+                        return False
+
         # uploads given file to given location in router
         def upload_file(self, args):
                 func_stat = 2
@@ -806,21 +1152,25 @@ class SSHConfiguration():
                         if path_in_dest.endswith("/"):
                                 path_in_dest = path_in_dest + filename
 
+                # an existing remote directory gets the file under its own name, the partial file
+                # couldn't be renamed over the directory
+                if self.remote_isdir(path_in_dest):
+                        path_in_dest = path_in_dest.rstrip("/") + "/" + filename
+
                 local_md5 = LocalHash.calculate_md5(path_in_orig)
-                remote_md5_cmd = "openssl md5 " + path_in_dest + " |awk '{print $2}'"
 
+                # uploaded files stay in router, so their digests are cached
                 try:
-                        self.sftp.put(path_in_orig, path_in_dest)
+                        remote_md5, source_note = self.transfer(path_in_orig, path_in_dest, local_md5, use_cache=True)
                 except FileNotFoundError:
                         error_msg = "Invalid local or remote path noticed while trying to transfer file " + filename
                         return error_msg, func_stat
 
-                ssh_stdin, ssh_stdout, ssh_stderr = self.conn.exec_command(remote_md5_cmd)
-                cmd_output = ssh_stdout.readlines()
-                remote_md5 = cmd_output[0].strip()
-
-                if local_md5 == remote_md5:
-                        status_msg = "File '" + filename + "' succesfully transferred to router"
+                if local_md5 == remote_md5 and source_note == self.identical_note:
+                        status_msg = "File '" + filename + "' is already in router, not transferred"
+                        func_stat = 1
+                elif local_md5 == remote_md5:
+                        status_msg = "File '" + filename + "' succesfully transferred to router" + source_note
                         func_stat = 0
                 else:
                         status_msg = "File '" + filename + "' couldn't be transferred, or it failed integrity check"
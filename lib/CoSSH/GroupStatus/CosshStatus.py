@@ -21,52 +21,55 @@
 #SOFTWARE.
 
 
-import subprocess
+import json
 from termcolor import colored
-from multiprocessing import Pool, TimeoutError
+from CoSSH.Utils.GroupRegistry import GroupRegistry
+from CoSSH.Utils.Prober import Prober
 
 class CosshStatus():
-	def __init__(self):
+	def __init__(self, registry=None):
 		self.client_file = "/etc/cossh/clients/clients.conf"
 
-	# function to get online hosts from a group
-	def get_online(self, clientgroup):
+		if registry == None:
+			registry = GroupRegistry(self.client_file)
+
+		self.registry = registry
 
-		client_list = []
-		client_bool = False
+	# function to get online hosts from a group
+	# every client is probed from this process, at most prober.max_parallel at once
+	# with json_file, results are also written there as a list of objects ("-" writes only them to stdout)
+	def get_online(self, clientgroup, prober=None, json_file=None):
 
 		try:
-			# read clients.conf file
-			with open(self.client_file) as cc:
-				for line in cc:
-
-					# try to search for a given group in clients.conf
-					if line.strip().startswith("@@") and line.strip().endswith("@@"):
-						if line.strip() == "@@" + clientgroup + "@@":
-							client_bool = True
-						else:
-							client_bool = False
-
-					# if group exists, append group's clients' IPv4 addresses to client_list
-					if client_bool == True and not line.strip().startswith("@@") and line.strip() != "":
-						client_ip = line.strip().split(":", 1)[0]
-						client_list.append(client_ip)
-
-			try:
-				# call ping_processes function and start each as its own process
-				ping_processes = Pool(processes=len(client_list))
-				data = ping_processes.map_async(self.ping_client, [client_list[i] for i in range(len(client_list))])
-				ping_processes.close()
-				ping_processes.join()
-
-			except TimeoutError:
-				print(colored("error", "red"))
-
-			except ValueError:
+			if prober == None:
+				prober = Prober()
+
+			# if group exists, collect group's clients
+			members = self.registry.members(clientgroup)
+
+			if len(members) == 0:
 				print(colored("No clients in group '" + clientgroup + "'", "red"))
+				return
 
-			except Exception as e:
-				print(colored(e, "red"))
+			results = prober.probe([member.ip for member in members])
+			online_count = 0
+
+			# JSON on stdout is left alone, so it can be piped to other tools
+			if json_file == "-":
+				self.write_probe_json(json_file, members, results)
+				return
+
+			for member in members:
+				if results[member.ip][0] == True:
+					online_count += 1
+					print(member.ip + ":" + colored(" Online", "green"))
+				else:
+					print(member.ip + ":" + colored(" Offline", "red"))
+
+			print("\nOnline: " + colored(str(online_count), "green") + ", offline: " + colored(str(len(members) - online_count), "red") + " (" + str(len(members)) + " clients, " + prober.method + " probe)")
+
+			if json_file != None:
+				self.write_probe_json(json_file, members, results)
 
 		except FileNotFoundError:
 			print(colored("No groups found (client.conf doesn't exist)", "red"))
@@ -74,26 +77,26 @@ class CosshStatus():
 		except Exception as e:
 			print(colored(e, "red"))
 
-	# function to ping a given IPv4 address
-	def ping_client(self, host):
-		cmd = "timeout 2 ping -c 1 " + host + " 2>&1 >/dev/null ;echo $?"
-		online_status = subprocess.check_output([cmd], shell=True).decode('utf-8').strip()
+	# writes probe results as JSON, one object per client
+	def write_probe_json(self, json_file, members, results):
+		data = [{"ip": member.ip, "serial": member.serial, "online": results[member.ip][0], "rtt": results[member.ip][1]} for member in members]
+
+		if json_file == "-":
+			print(json.dumps(data, indent=2))
+			return
 
-		if online_status == "0":
-			print(host + ":" + colored(" Online", "green"))
-		else:
-			print(host + ":" + colored(" Offline", "red"))
+		with open(json_file, "w") as jf:
+			json.dump(data, jf, indent=2)
+			jf.write("\n")
 
 	# fetches existing client groups
 	def get_groups(self):
 		group_count = 0
 
 		try:
-			with open(self.client_file) as clients:
-				for client in clients:
-					if client.startswith("@@"):
-						group_count += 1
-						print(client.replace("@@", "").strip())
+			for group in self.registry.groups():
+				group_count += 1
+				print(group)
 
 			if group_count == 0:
 				print(colored("No groups found", "red"))
@@ -121,6 +124,7 @@ class CosshStatus():
 				ef.write("# change-passwd = <user_name>, <password>\nchange-passwd = cossh_user, MynewP455!?\n\n")
 				ef.write("# create-user = <user_name>, <password>, admin/regular\ncreate-user = cossh_user, B1gsecret10-!, admin\n\n")
 				ef.write("# delete-user = <user_name>\ndelete-user = cossh_user\n\n")
+				ef.write("# distribute = <prefix_length_of_a_site>\ndistribute = 24\n\n")
 				ef.write("# latest-update = show\nlatest-update = show\n\n")
 				ef.write("# login = <IPv4 address>, <password>\nlogin = 192.168.1.1, toor\n\n")
 				ef.write("# login-group = <group>\nlogin-group = cossh_group\n\n")
@@ -129,9 +133,10 @@ class CosshStatus():
 				ef.write("# remove-um = <user_module_name>\nremove-um = mymodule\n\n")
 				ef.write("# router-command = <custom command>\nrouter-command = /etc/init.d/eth restart\n\n")
 				ef.write("# save-unique = true\nsave-unique = true\n\n")
-				ef.write("# sws = <setting_value_pair>\nsws = SNMP_NAME=example_name\n\n")
+				ef.write("# sws = <setting_value_pair>[, <setting_value_pair>, ...]\nsws = SNMP_NAME=example_name\n\n")
+				ef.write("# update-fw = <path_to_firmware>\nupdate-fw = /home/cossh/firmware/firmware.bin\n\n")
 				ef.write("# update-name = <custom update message>\nupdate-name = Updated firmware to 6.1.5\n\n")
-				ef.write("# upload-cfg = <path_to_cfg_file>, standard/alt1/alt2/alt3\nupload-cfg = /home/cossh/configs/router_settings.cfg, standard\n\n")
+				ef.write("# upload-cfg = <path_to_cfg_file>, standard/alt1/alt2/alt3[, delta]\nupload-cfg = /home/cossh/configs/router_settings.cfg, standard\n\n")
 				ef.write("# upload-file = <path_to_local_file>, <path_to_remote_location>\n\nupload-file = /home/cossh/files/example_file.txt, /root\n\n")
 				ef.write("# write-excel = <custom_value>, <path_to_excel_file>, <sheet_name>, <column>\nwrite-excel = $serial, /home/cossh/data/routers.xlsx, routers, B\n")
 
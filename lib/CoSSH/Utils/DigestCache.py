@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+
+import os
+import time
+import sqlite3
+import threading
+
+# file digests cached in a local SQLite database, shared by every cossh process
+#
+# the cache is only an optimization: if it can't be opened (missing directory, no permissions),
+# lookups miss and stores are ignored
+class DigestCache():
+
+	schema = ("CREATE TABLE IF NOT EXISTS remote_digests (serial TEXT NOT NULL, path TEXT NOT NULL, digest TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (serial, path))",
+		  "CREATE TABLE IF NOT EXISTS local_digests (path TEXT NOT NULL, algorithm TEXT NOT NULL, size INTEGER NOT NULL, mtime INTEGER NOT NULL, inode INTEGER NOT NULL, digest TEXT NOT NULL, PRIMARY KEY (path, algorithm))",)
+
+	def __init__(self, db_file="/etc/cossh/cache/digests.db"):
+		self.db_file = db_file
+		self.local = threading.local()
+
+	# every process and thread uses its own database connection, connections can't be shared after fork
+	def connection(self):
+		db = getattr(self.local, "db", None)
+
+		if db == None or self.local.pid != os.getpid():
+			db = sqlite3.connect(self.db_file, timeout=30)
+
+			with db:
+				for statement in self.schema:
+					db.execute(statement)
+
+			self.local.db = db
+			self.local.pid = os.getpid()
+
+		return db
+
+# remembers digests of files cossh has put in routers, keyed by router's serial number and remote path
+# lets repeated uploads of the same file be skipped without asking the router for the file's digest
+class RemoteDigestCache(DigestCache):
+
+	# digest of a file in router, None if it isn't known
+	def get(self, serial, path):
+		try:
+			row = self.connection().execute("SELECT digest FROM remote_digests WHERE serial = ? AND path = ?", (serial, path)).fetchone()
+		except sqlite3.Error:
+			return None
+
+		if row == None:
+			return None
+
+		return row[0]
+
+	def set(self, serial, path, digest):
+		try:
+			db = self.connection()
+
+			with db:
+				db.execute("INSERT OR REPLACE INTO remote_digests (serial, path, digest, updated) VALUES (?, ?, ?, ?)", (serial, path, digest, time.time()))
+
+		except sqlite3.Error:
+			pass
+
+	# forgets a file which was removed from router or whose content isn't known anymore
+	def forget(self, serial, path):
+		try:
+			db = self.connection()
+
+			with db:
+				db.execute("DELETE FROM remote_digests WHERE serial = ? AND path = ?", (serial, path))
+
+		except sqlite3.Error:
+			pass
+
+# remembers digests of local files, a digest is valid while file's size, modification time and inode stay the same
+class LocalDigestCache(DigestCache):
+
+	def get(self, path, algorithm, size, mtime, inode):
+		try:
+			row = self.connection().execute("SELECT digest FROM local_digests WHERE path = ? AND algorithm = ? AND size = ? AND mtime = ? AND inode = ?", (path, algorithm, size, mtime, inode)).fetchone()
+		except sqlite3.Error:
+			return None
+
+		if row == None:
+			return None
+
+		return row[0]
+
+	def set(self, path, algorithm, size, mtime, inode, digest):
+		try:
+			db = self.connection()
+
+			with db:
+				db.execute("INSERT OR REPLACE INTO local_digests (path, algorithm, size, mtime, inode, digest) VALUES (?, ?, ?, ?, ?, ?)", (path, algorithm, size, mtime, inode, digest))
+
+		except sqlite3.Error:
+			pass
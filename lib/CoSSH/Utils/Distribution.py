@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+
+import os
+import ipaddress
+from termcolor import colored
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from CoSSH.Utils.Hashing import LocalHash
+
+# distributes large files (firmware, user modules) to a group with one upload per site
+# a site is a network of given prefix length (routers 10.0.1.x with prefix length 24)
+# each file is uploaded from this host to one staging router per site, the staging router serves it
+# over HTTP and the rest of the site's routers download it from there
+#
+# every hop is verified with md5: the staged copy before it's served, and every downloaded copy in
+# SSHConfiguration.put_file, which falls back to uploading from this host if the download fails
+class Distribution():
+
+	# files are staged in RAM (/tmp) of the staging router
+	stage_dir = "/tmp/cossh-dist"
+
+	# amount of routers tried per site before the site falls back to direct uploads
+	stage_attempts = 3
+
+	def __init__(self, files, prefix_length=24, port=8099, silent=False):
+		self.prefix_length = prefix_length
+		self.port = port
+		self.silent = silent
+		self.files = OrderedDict()
+		self.stages = {}
+
+		# routers a server may have been started on, also the ones whose staging failed or was interrupted
+		self.started = set()
+
+		# staged file name contains the file's md5, so different versions never get mixed up
+		for path in files:
+			path = os.path.abspath(path)
+			digest = LocalHash.calculate_md5(path)
+			self.files[path] = (digest, digest + "-" + os.path.basename(path))
+
+	def site(self, ip_address):
+		return str(ipaddress.ip_network(ip_address + "/" + str(self.prefix_length), strict=False))
+
+	# splits login lines into sites, login line starts with router's IPv4 address
+	def sites(self, login_lines):
+		sites = OrderedDict()
+
+		for login_line in login_lines:
+			ip_address = login_line.split(",", 1)[0]
+			sites.setdefault(self.site(ip_address), []).append(login_line)
+
+		return sites
+
+	# uploads the files to one router per site and starts serving them, sites are staged in parallel
+	# login(login_line) returns (conn, sftp, conn_stat) like ssh_login in cossh
+	def stage(self, login, login_lines, max_parallel=16):
+		sites = self.sites(login_lines)
+
+		if len(sites) == 0 or len(self.files) == 0:
+			return
+
+		with ThreadPoolExecutor(max_workers=min(max_parallel, len(sites))) as executor:
+			staged = executor.map(lambda site: (site, self.stage_site(login, sites[site])), sites)
+
+			for site, stage_ip in staged:
+				if stage_ip != None:
+					self.stages[site] = stage_ip
+
+		if self.silent == False:
+			print(colored("Files staged in " + str(len(self.stages)) + "/" + str(len(sites)) + " sites, data uploaded from this host: " + str(round(self.uploaded_size() * len(self.stages) / 1048576, 1)) + " MB", "yellow"))
+
+	def stage_site(self, login, login_lines):
+		for login_line in login_lines[:self.stage_attempts]:
+			ip_address = login_line.split(",", 1)[0]
+			conn, sftp, conn_stat = login(login_line)
+
+			if conn_stat != 0:
+				continue
+
+			self.started.add(ip_address)
+
+			try:
+				if self.stage_router(conn, sftp, ip_address) == True:
+					if self.silent == False:
+						print(colored("Site " + self.site(ip_address) + " staged on " + ip_address + " (" + str(len(login_lines)) + " routers)", "yellow"))
+					return ip_address
+
+				self.unstage_router(conn)
+				self.started.discard(ip_address)
+
+			except Exception as e:
+				print(ip_address + ": " + colored("Staging failed: " + str(e), "red"))
+
+				# the server is stopped now if the connection still works, otherwise by cleanup()
+				try:
+					self.unstage_router(conn)
+					self.started.discard(ip_address)
+				except Exception:
+					pass
+
+			finally:
+				conn.close()
+				sftp.close()
+
+		if self.silent == False:
+			print(colored("Site " + self.site(login_lines[0].split(",", 1)[0]) + " couldn't be staged, files are uploaded to its routers directly", "red"))
+
+		return None
+
+	def stage_router(self, conn, sftp, ip_address):
+		self.run(conn, "mkdir -p " + self.stage_dir)
+
+		for path, (digest, name) in self.files.items():
+			remote_path = self.stage_dir + "/" + name
+			sftp.put(path, remote_path)
+
+			if self.remote_md5(conn, remote_path) != digest:
+				return False
+
+		# busybox httpd and uhttpd both go to background by themselves
+		# the server has no authentication, so it only listens on the address the site's routers download from
+		listen = ip_address + ":" + str(self.port)
+		status, output = self.run(conn, "busybox httpd -p " + listen + " -h " + self.stage_dir + " 2>/dev/null || uhttpd -p " + listen + " -h " + self.stage_dir)
+		if status != 0:
+			return False
+
+		# the router downloads one of the files from itself, so that the server is known to work
+		digest, name = next(iter(self.files.values()))
+		status, output = self.run(conn, "sleep 1; wget -q -T 10 -O - " + self.url(ip_address, name) + " |openssl md5 |awk '{print $NF}'")
+
+		return output.strip() == digest
+
+	def unstage_router(self, conn):
+		self.run(conn, "for pid in $(ps w |grep '[h]ttpd.*" + self.stage_dir + "' |awk '{print $1}'); do kill $pid; done; rm -rf " + self.stage_dir)
+
+	# stops the servers and removes staged files from staging routers
+	def cleanup(self, login, login_lines):
+		staged_ips = set(self.stages.values()) | self.started
+
+		for login_line in login_lines:
+			ip_address = login_line.split(",", 1)[0]
+
+			if ip_address not in staged_ips:
+				continue
+
+			conn, sftp, conn_stat = login(login_line)
+
+			if conn_stat != 0:
+				print(colored("Couldn't remove staged files from " + ip_address + ", they will be gone after reboot", "red"))
+				continue
+
+			try:
+				self.unstage_router(conn)
+			finally:
+				conn.close()
+				sftp.close()
+
+	# local path -> (url, md5) for every file staged in router's site
+	def sources(self, ip_address):
+		stage_ip = self.stages.get(self.site(ip_address))
+
+		if stage_ip == None:
+			return {}
+
+		return {path: (self.url(stage_ip, name), digest) for path, (digest, name) in self.files.items()}
+
+	def url(self, ip_address, name):
+		return "http://" + ip_address + ":" + str(self.port) + "/" + name
+
+	def uploaded_size(self):
+		return sum(os.path.getsize(path) for path in self.files)
+
+	def remote_md5(self, conn, remote_path):
+		status, output = self.run(conn, "openssl md5 " + remote_path + " |awk '{print $2}'")
+		return output.strip()
+
+	def run(self, conn, command):
+		ssh_stdin, ssh_stdout, ssh_stderr = conn.exec_command(command)
+		output = ssh_stdout.read().decode("utf-8", "replace")
+		return ssh_stdout.channel.recv_exit_status(), output
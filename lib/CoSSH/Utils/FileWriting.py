@@ -23,6 +23,8 @@
 
 from termcolor import colored
 import os
+import stat
+import fcntl
 import tempfile
 
 class InPlaceReplacement():
@@ -31,14 +33,8 @@ class InPlaceReplacement():
 	def replace_string(old, new, filename):
 
 		try:
-			with tempfile.NamedTemporaryFile('w', delete=False) as outfile:
-				with open(filename) as infile:
-					for line in infile:
-						if old in line:
-							line = line.replace(old, new)
-						outfile.write(line)
-
-			os.replace(outfile.name, filename)
+			with BatchEdit(filename) as batch:
+				batch.replace_string(old, new)
 
 		except FileNotFoundError:
 			print(colored(filename + ", no such file or directory", "red"))
@@ -53,14 +49,8 @@ class InPlaceReplacement():
 	def after_string(match, string, filename):
 
 		try:
-			with tempfile.NamedTemporaryFile('w', delete=False) as outfile:
-				with open(filename) as infile:
-					for line in infile:
-						outfile.write(line)
-						if match in line:
-							outfile.write(string + "\n")
-
-			os.replace(outfile.name, filename)
+			with BatchEdit(filename) as batch:
+				batch.after_string(match, string)
 
 		except FileNotFoundError:
 			print(colored(filename + ", no such file or directory", "red"))
@@ -75,13 +65,8 @@ class InPlaceReplacement():
 	def remove_string_line(string_line, filename):
 
 		try:
-			with tempfile.NamedTemporaryFile('w', delete=False) as outfile:
-				with open(filename) as infile:
-					for line in infile:
-						if not string_line in line:
-							outfile.write(line)
-
-			os.replace(outfile.name, filename)
+			with BatchEdit(filename) as batch:
+				batch.remove_string_line(string_line)
 
 		except FileNotFoundError:
 			print(colored(filename + ", no such file or directory", "red"))
@@ -95,13 +80,8 @@ class InPlaceReplacement():
 	def remove_string_lines(string_lines, filename):
 
 		try:
-			with tempfile.NamedTemporaryFile('w', delete=False) as outfile:
-				with open(filename) as infile:
-					for line in infile:
-						if not any(string in line for string in string_lines):
-							outfile.write(line)
-
-			os.replace(outfile.name, filename)
+			with BatchEdit(filename) as batch:
+				batch.remove_string_lines(string_lines)
 
 		except FileNotFoundError:
 			print(colored(filename + ", no such file or directory", "red"))
@@ -120,8 +100,142 @@ class InPlaceReplacement():
 				else:
 					return False
 		except PermissionError:
-			print(colored("Invalid file permissions for '" + filename + "'", "red"))
+			print(colored("Invalid file permissions for '" + cfg_file + "'", "red"))
 
 		except Exception as e:
 			print(colored(e, "red"))
 
+# queues many edits to a file and applies them in a single pass while the file is locked
+# edits are applied in the order they were queued, each edit sees the result of the previous ones
+#
+#	with BatchEdit("/etc/cossh/clients/clients.conf") as batch:
+#		batch.after_string("@@group@@", "10.0.0.1:1234")
+#		batch.remove_line("10.0.0.2:5678")
+#
+# the file is rewritten when the with block ends without an error, errors leave the file untouched
+class BatchEdit():
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.edits = []
+		self.lock_file = None
+
+	def __enter__(self):
+		self.lock()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		try:
+			if exc_type == None:
+				self.commit()
+		finally:
+			self.unlock()
+
+		return False
+
+	# every process editing the file takes an exclusive lock on <filename>.lock
+	# a separate lock file is used, because the file itself is replaced on every commit
+	def lock(self):
+		self.lock_file = open(self.filename + ".lock", "a")
+		fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+
+	def unlock(self):
+		if self.lock_file != None:
+			fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+			self.lock_file.close()
+			self.lock_file = None
+
+	# replaces matching strings with given strings
+	def replace_string(self, old, new):
+		def edit(lines):
+			for line in lines:
+				if old in line:
+					line = line.replace(old, new)
+				yield line
+
+		self.edits.append(edit)
+
+	# writes a given string after matching strings
+	def after_string(self, match, string):
+		def edit(lines):
+			for line in lines:
+				yield line
+				if match in line:
+					yield string + "\n"
+
+		self.edits.append(edit)
+
+	# writes a given string at the end of the file
+	def append_string(self, string):
+		def edit(lines):
+			for line in lines:
+				yield line
+			yield string + "\n"
+
+		self.edits.append(edit)
+
+	# removes lines where matching strings are found
+	def remove_string_line(self, string_line):
+		self.remove_string_lines([string_line])
+
+	def remove_string_lines(self, string_lines):
+		def edit(lines):
+			for line in lines:
+				if not any(string in line for string in string_lines):
+					yield line
+
+		self.edits.append(edit)
+
+	# removes lines which are exactly the given string (surrounding whitespace ignored)
+	def remove_line(self, exact_line):
+		self.remove_lines([exact_line])
+
+	def remove_lines(self, exact_lines):
+		exact_lines = set(exact_lines)
+
+		def edit(lines):
+			for line in lines:
+				if not line.strip() in exact_lines:
+					yield line
+
+		self.edits.append(edit)
+
+	# applies queued edits and atomically replaces the file with the result
+	def commit(self):
+		if len(self.edits) == 0:
+			return
+
+		directory = os.path.dirname(os.path.abspath(self.filename))
+		file_mode = stat.S_IMODE(os.stat(self.filename).st_mode)
+
+		# temporary file is created next to the file, so that os.replace stays on the same filesystem
+		outfile = tempfile.NamedTemporaryFile('w', dir=directory, prefix=".cossh-", delete=False)
+
+		try:
+			with outfile:
+				with open(self.filename) as infile:
+					lines = infile
+					for edit in self.edits:
+						lines = edit(lines)
+
+					for line in lines:
+						outfile.write(line)
+
+				outfile.flush()
+				os.fsync(outfile.fileno())
+
+			os.chmod(outfile.name, file_mode)
+			os.replace(outfile.name, self.filename)
+
+		except BaseException:
+			os.unlink(outfile.name)
+			raise
+
+		# make the rename itself durable
+		dir_fd = os.open(directory, os.O_RDONLY)
+		try:
+			os.fsync(dir_fd)
+		finally:
+			os.close(dir_fd)
+
+		self.edits = []
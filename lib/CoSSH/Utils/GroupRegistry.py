@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import os
+from collections import namedtuple
+from CoSSH.Utils.FileWriting import BatchEdit
+
+# single client in a group, line is the client's line in clients.conf (<ip>:<serial>)
+Member = namedtuple("Member", ["ip", "serial", "line"])
+
+class GroupRegistry():
+
+	# clients.conf is parsed into indexes, which are rebuilt only when the file changes
+	def __init__(self, client_file="/etc/cossh/clients/clients.conf"):
+		self.client_file = client_file
+		self.signature = None
+		self.group_index = {}
+		self.ip_index = {}
+		self.serial_index = {}
+
+	# reads clients.conf again if its modification time, size or inode changed since the last read
+	# raises FileNotFoundError and PermissionError like open()
+	def refresh(self):
+		with open(self.client_file) as cc:
+			stat = os.fstat(cc.fileno())
+			signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+			if signature == self.signature:
+				return
+
+			group_index = {}
+			ip_index = {}
+			serial_index = {}
+			group = None
+
+			for line in cc:
+				stripped_line = line.strip()
+
+				# lines which start and end with @@ start a new group
+				if stripped_line.startswith("@@") and stripped_line.endswith("@@") and len(stripped_line) > 4:
+					group = stripped_line[2:-2]
+					group_index.setdefault(group, [])
+
+				elif group != None and stripped_line != "" and not stripped_line.startswith("@@"):
+					client_ip = stripped_line.split(":", 1)[0]
+					client_serial = stripped_line.split(":", 1)[1] if ":" in stripped_line else ""
+
+					group_index[group].append(Member(client_ip, client_serial, stripped_line))
+					ip_index.setdefault(client_ip, []).append(group)
+
+					if client_serial != "":
+						serial_index[client_serial] = group
+
+		self.group_index = group_index
+		self.ip_index = ip_index
+		self.serial_index = serial_index
+		self.signature = signature
+
+	# names of all groups, in the same order as in clients.conf
+	def groups(self):
+		self.refresh()
+		return list(self.group_index)
+
+	def has_group(self, group):
+		self.refresh()
+		return group in self.group_index
+
+	# group's clients as Member tuples
+	def members(self, group):
+		self.refresh()
+		return list(self.group_index.get(group, []))
+
+	# groups that have a client with a given IPv4 address, two groups may share the same address
+	def groups_of_ip(self, ip_address):
+		self.refresh()
+		return list(self.ip_index.get(ip_address, []))
+
+	def in_group(self, ip_address, group):
+		return group in self.groups_of_ip(ip_address)
+
+	# group of a device with a given serial number, None if the device doesn't belong to any group
+	def group_of_serial(self, serial):
+		self.refresh()
+		return self.serial_index.get(serial)
+
+	# adds a client to a group, the group is created if it doesn't exist
+	# returns False if the device is already in a group or the address is taken in the group
+	def add_client(self, group, ip_address, serial):
+		with BatchEdit(self.client_file) as batch:
+			if self.group_of_serial(serial) != None or self.in_group(ip_address, group):
+				return False
+
+			if not self.has_group(group):
+				batch.append_string("\n@@" + group + "@@")
+				batch.append_string(ip_address + ":" + serial)
+			else:
+				batch.after_string("@@" + group + "@@", ip_address + ":" + serial)
+
+		return True
+
+	# removes a group and its clients, returns False if the group doesn't exist
+	def delete_group(self, group):
+		with BatchEdit(self.client_file) as batch:
+			if not self.has_group(group):
+				return False
+
+			batch.remove_lines(["@@" + group + "@@"] + [member.line for member in self.members(group)])
+
+		return True
+
+	# removes a device from its group, returns False if the device doesn't belong to any group
+	def remove_device(self, serial):
+		with BatchEdit(self.client_file) as batch:
+			group = self.group_of_serial(serial)
+
+			if group == None:
+				return False
+
+			# only the device's own line is removed, not lines where the serial is a substring
+			batch.remove_lines([member.line for member in self.members(group) if member.serial == serial])
+
+		return True
+
+	# clients.conf can't store device facts, facts are only kept by SQLiteInventory
+	def set_facts(self, ip_address, facts):
+		pass
+
+	def get_facts(self, ip_address, max_age=None):
+		return {}
@@ -21,27 +21,37 @@
 #SOFTWARE.
 
 
-from CoSSH.Utils.FileWriting import InPlaceReplacement
+from CoSSH.Utils.GroupRegistry import GroupRegistry
 from termcolor import colored
 import os
 import sys
 
 class DeleteObject():
 
-	def __init__(self):
+	def __init__(self, registry=None):
 		self.client_conf = "/etc/cossh/clients/clients.conf"
 
-	def delete_group(self, groupname):
-		group = self.catch_group(groupname)
+		if registry == None:
+			registry = GroupRegistry(self.client_conf)
 
-		if not group:
-			print(colored("Group '" + groupname + "' doesn't exist", "red"))
-			sys.exit()
+		self.registry = registry
 
+	def delete_group(self, groupname):
 		public_key = "/etc/cossh/keys/cossh-key_" + groupname + ".pub"
 		private_key = "/etc/cossh/keys/cossh-key_" + groupname
 
-		InPlaceReplacement.remove_string_lines(group, self.client_conf)
+		try:
+			if not self.registry.delete_group(groupname):
+				print(colored("Group '" + groupname + "' doesn't exist", "red"))
+				sys.exit()
+
+		except FileNotFoundError:
+			print(colored(self.client_conf + " doesn't exist", "red"))
+			sys.exit()
+
+		except PermissionError:
+			print(colored("You are not permitted to deal with the groups", "red"))
+			sys.exit()
 
 		print(colored("Group '" + groupname + "' deleted", "green"))
 
@@ -60,33 +70,29 @@ class DeleteObject():
 
 
 	def remove_device(self, serial):
-		check_string = InPlaceReplacement.search_string(self.client_conf, serial)
-
-		if check_string == True:
-			InPlaceReplacement.remove_string_line(serial, self.client_conf)
-			print(colored("Device '" + str(serial) + "' removed from its host group", "green"))
-		else:
-			print(colored("Device '" + str(serial) + "' doesn't belong to any group", "yellow"))
+		try:
+			if not self.registry.remove_device(serial):
+				print(colored("Device '" + str(serial) + "' doesn't belong to any group", "yellow"))
+				return
 
-	def catch_group(self, groupname):
+		except FileNotFoundError:
+			print(colored(self.client_conf + " doesn't exist", "red"))
+			sys.exit()
 
-		group_member = False
-		group_members = []
+		except PermissionError:
+			print(colored("You are not permitted to deal with the groups", "red"))
+			sys.exit()
 
-		try:
-			with open(self.client_conf) as cc:
-				for line in cc:
-					stripped_line = line.strip()
-					if stripped_line == "@@" + groupname + "@@":
-						group_member = True
+		print(colored("Device '" + str(serial) + "' removed from its host group", "green"))
 
-					elif stripped_line.startswith("@@") or stripped_line == "":
-						group_member = False
+	def catch_group(self, groupname):
 
-					if group_member == True:
-						group_members.append(stripped_line)
+		try:
+			if not self.registry.has_group(groupname):
+				return []
 
-				return group_members
+			# group's header line and its clients' lines
+			return ["@@" + groupname + "@@"] + [member.line for member in self.registry.members(groupname)]
 
 		except FileNotFoundError:
 			print(colored("/etc/cossh/clients/clients.conf doesn't exist", "red"))
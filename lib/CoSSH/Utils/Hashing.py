@@ -21,17 +21,53 @@
 #SOFTWARE.
 
 
+import os
 import hashlib
+from CoSSH.Utils.DigestCache import LocalDigestCache
 
 class LocalHash():
 
+	# files are hashed in blocks, so memory use doesn't grow with file size
+	block_size = 1048576
+
+	algorithms = ("md5", "sha256")
+
+	# digests of files hashed in this process, inherited by configuration processes forked later
+	# keyed by path, algorithm, size, modification time and inode, so a changed file is hashed again
+	digests = {}
+
+	# the same digests shared with other processes and later runs
+	cache = LocalDigestCache()
+
 	def calculate_md5(filepath):
-		try:
-			with open(filepath, "rb") as fp:
-				file_data = fp.read()
-				md5_sum = hashlib.md5(file_data).hexdigest()
+		return LocalHash.calculate(filepath, "md5")
+
+	def calculate_sha256(filepath):
+		return LocalHash.calculate(filepath, "sha256")
+
+	# raises the same errors as open() if the file can't be read, and ValueError for unsupported algorithms
+	def calculate(filepath, algorithm="md5"):
+		if algorithm not in LocalHash.algorithms:
+			raise ValueError("Unsupported hash algorithm '" + algorithm + "'")
+
+		with open(filepath, "rb") as fp:
+			file_stat = os.fstat(fp.fileno())
+			key = (os.path.abspath(filepath), algorithm, file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+			digest = LocalHash.digests.get(key)
+
+			if digest == None:
+				digest = LocalHash.cache.get(*key)
+
+			if digest == None:
+				file_hash = hashlib.new(algorithm)
+
+				for block in iter(lambda: fp.read(LocalHash.block_size), b""):
+					file_hash.update(block)
+
+				digest = file_hash.hexdigest()
+				LocalHash.cache.set(*key, digest)
 
-			return md5_sum
+			LocalHash.digests[key] = digest
 
-		except Exception as e:
-			return e
+		return digest
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import os
+import time
+import sqlite3
+import threading
+from CoSSH.Utils.GroupRegistry import GroupRegistry, Member
+
+# device inventory stored in a local SQLite database
+# drop-in replacement for GroupRegistry, which keeps the groups in clients.conf
+class SQLiteInventory():
+
+	schema = ("CREATE TABLE IF NOT EXISTS groups (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+		  "CREATE TABLE IF NOT EXISTS devices (id INTEGER PRIMARY KEY, group_id INTEGER NOT NULL REFERENCES groups(id) ON DELETE CASCADE, ip TEXT NOT NULL, serial TEXT NOT NULL UNIQUE, UNIQUE (group_id, ip))",
+		  "CREATE INDEX IF NOT EXISTS devices_ip ON devices (ip)",
+		  "CREATE TABLE IF NOT EXISTS facts (ip TEXT NOT NULL, name TEXT NOT NULL, value TEXT, updated REAL NOT NULL, PRIMARY KEY (ip, name))",)
+
+	def __init__(self, db_file="/etc/cossh/clients/inventory.db"):
+		self.db_file = db_file
+		self.local = threading.local()
+
+	# every process and thread uses its own database connection, connections can't be shared after fork
+	def connection(self):
+		db = getattr(self.local, "db", None)
+
+		if db == None or self.local.pid != os.getpid():
+			db = sqlite3.connect(self.db_file, timeout=30)
+			db.execute("PRAGMA foreign_keys = ON")
+
+			with db:
+				for statement in self.schema:
+					db.execute(statement)
+
+			self.local.db = db
+			self.local.pid = os.getpid()
+
+		return db
+
+	# names of all groups, in the order they were created
+	def groups(self):
+		rows = self.connection().execute("SELECT name FROM groups ORDER BY id")
+		return [row[0] for row in rows]
+
+	def has_group(self, group):
+		row = self.connection().execute("SELECT 1 FROM groups WHERE name = ?", (group,)).fetchone()
+		return row != None
+
+	# group's clients as Member tuples, like in GroupRegistry
+	def members(self, group):
+		rows = self.connection().execute("SELECT devices.ip, devices.serial FROM devices JOIN groups ON groups.id = devices.group_id WHERE groups.name = ? ORDER BY devices.id", (group,))
+		return [Member(row[0], row[1], row[0] + ":" + row[1]) for row in rows]
+
+	# groups that have a client with a given IPv4 address, two groups may share the same address
+	def groups_of_ip(self, ip_address):
+		rows = self.connection().execute("SELECT groups.name FROM devices JOIN groups ON groups.id = devices.group_id WHERE devices.ip = ? ORDER BY groups.id", (ip_address,))
+		return [row[0] for row in rows]
+
+	def in_group(self, ip_address, group):
+		return group in self.groups_of_ip(ip_address)
+
+	# group of a device with a given serial number, None if the device doesn't belong to any group
+	def group_of_serial(self, serial):
+		row = self.connection().execute("SELECT groups.name FROM devices JOIN groups ON groups.id = devices.group_id WHERE devices.serial = ?", (serial,)).fetchone()
+
+		if row == None:
+			return None
+
+		return row[0]
+
+	# adds a client to a group, the group is created if it doesn't exist
+	# returns False if the device is already in a group or the address is taken in the group
+	def add_client(self, group, ip_address, serial):
+		db = self.connection()
+
+		try:
+			with db:
+				db.execute("INSERT OR IGNORE INTO groups (name) VALUES (?)", (group,))
+				db.execute("INSERT INTO devices (group_id, ip, serial) SELECT id, ?, ? FROM groups WHERE name = ?", (ip_address, serial, group))
+
+		except sqlite3.IntegrityError:
+			return False
+
+		return True
+
+	# removes a group and its clients, returns False if the group doesn't exist
+	def delete_group(self, group):
+		db = self.connection()
+
+		with db:
+			cursor = db.execute("DELETE FROM groups WHERE name = ?", (group,))
+
+		return cursor.rowcount > 0
+
+	# removes a device from its group, returns False if the device doesn't belong to any group
+	def remove_device(self, serial):
+		db = self.connection()
+
+		with db:
+			cursor = db.execute("DELETE FROM devices WHERE serial = ?", (serial,))
+
+		return cursor.rowcount > 0
+
+	# stores facts (serial, mac, model...) fetched from a router
+	def set_facts(self, ip_address, facts):
+		db = self.connection()
+		updated = time.time()
+
+		with db:
+			db.executemany("INSERT OR REPLACE INTO facts (ip, name, value, updated) VALUES (?, ?, ?, ?)", [(ip_address, name, value, updated) for name, value in facts.items()])
+
+	# returns stored facts of a router, facts older than max_age seconds are left out
+	def get_facts(self, ip_address, max_age=None):
+		if max_age == None:
+			rows = self.connection().execute("SELECT name, value FROM facts WHERE ip = ?", (ip_address,))
+		else:
+			rows = self.connection().execute("SELECT name, value FROM facts WHERE ip = ? AND updated >= ?", (ip_address, time.time() - max_age))
+
+		return dict(rows.fetchall())
+
+	# imports groups and their clients from clients.conf, returns the amount of imported groups and devices
+	# devices which already exist in the inventory are skipped
+	def import_clients(self, client_file="/etc/cossh/clients/clients.conf"):
+		registry = GroupRegistry(client_file)
+		db = self.connection()
+		group_count = 0
+		device_count = 0
+
+		with db:
+			for group in registry.groups():
+				cursor = db.execute("INSERT OR IGNORE INTO groups (name) VALUES (?)", (group,))
+				group_count += cursor.rowcount
+
+				for member in registry.members(group):
+					cursor = db.execute("INSERT OR IGNORE INTO devices (group_id, ip, serial) SELECT id, ?, ? FROM groups WHERE name = ?", (member.ip, member.serial, group))
+					device_count += cursor.rowcount
+
+		return group_count, device_count
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import os
+import json
+import datetime
+
+# appends a JSON record as a single line with a single write, processes can share the file
+def append_record(path, record):
+	data = (json.dumps(record) + "\n").encode("utf-8")
+	fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+	try:
+		os.write(fd, data)
+	finally:
+		os.close(fd)
+
+# journal of a group run, one JSON object per line
+#
+# every record is appended with a single write, so worker processes (and threads of the async engine)
+# can write to the same journal while routers are configured, and a run stopped halfway still leaves
+# everything done so far in the journal
+#
+# record types:
+#   {"run": <start time>, "group": ..., "cfg": ..., "cfg_md5": ..., "resume": <bool>}
+#   {"ip": ..., "line": <line in cfg>, "function": ..., "status": 0/1/2, "message": ..., "attempt": <n>}
+#   {"ip": ..., "result": "done"/"failed"/"retry"/"unreachable", "message": ..., "attempt": <n>}
+#   {"halt": <time>, "wave": <n>, "failure_rate": <percent>, "threshold": <percent>}
+class RunJournal():
+
+	# operation status 0 (changed) and 1 (nothing to change) mean the operation doesn't need to be run again
+	completed_status = (0, 1)
+
+	def __init__(self, journal_file):
+		self.journal_file = journal_file
+
+		# ip -> lines of completed operations
+		self.completed = {}
+
+		# run records in the order they were written
+		self.runs = []
+
+	# reads an existing journal, a line cut short by a stopped run is ignored
+	# reading again picks up records written by other processes
+	def load(self):
+		self.completed = {}
+		self.runs = []
+
+		with open(self.journal_file) as jf:
+			for line in jf:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					continue
+
+				if "run" in record:
+					self.runs.append(record)
+
+				elif "line" in record and record.get("status") in self.completed_status:
+					self.completed.setdefault(record["ip"], set()).add(record["line"])
+
+	# lines of operations already completed in router
+	def completed_lines(self, ip_address):
+		return self.completed.get(ip_address, set())
+
+	# router is complete when every given operation line is completed
+	def is_complete(self, ip_address, lines):
+		return set(lines) <= self.completed_lines(ip_address)
+
+	def start(self, group, cfgfile, cfg_md5, resume=False):
+		self.write({"run": datetime.datetime.now().isoformat(timespec="seconds"), "group": group, "cfg": os.path.abspath(cfgfile), "cfg_md5": cfg_md5, "resume": resume})
+
+	def operation(self, ip_address, line, function, status, message, attempt=1):
+		if status in self.completed_status:
+			self.completed.setdefault(ip_address, set()).add(line)
+
+		self.write({"ip": ip_address, "line": line, "function": function, "status": status, "message": message, "attempt": attempt})
+
+	def result(self, ip_address, result, message="", attempt=1):
+		self.write({"ip": ip_address, "result": result, "message": message, "attempt": attempt})
+
+	# rollout halted before the given wave, routers of the rest of the waves have no records
+	def halt(self, wave, failure_rate, threshold):
+		self.write({"halt": datetime.datetime.now().isoformat(timespec="seconds"), "wave": wave, "failure_rate": round(failure_rate, 1), "threshold": threshold})
+
+	def write(self, record):
+		append_record(self.journal_file, record)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# metrics of a running cossh, in Prometheus text exposition format
+#
+# the parent process is fed by Reporter: progress of the scheduler and results of routers, which carry
+# the timing records of their routers (RouterTiming), so workers don't need to share anything
+# metrics are served over HTTP (serve()) for scraping, or written to a file for node_exporter's
+# textfile collector (write_file())
+class Metrics():
+
+	connect_buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+	operation_buckets = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+	results = ("done", "failed", "retry", "unreachable")
+
+	# textfile is rewritten at most this often (seconds), and when the run ends
+	file_interval = 5
+
+	def __init__(self, metrics_file=None):
+		self.metrics_file = metrics_file
+		self.lock = threading.Lock()
+		self.queued = 0
+		self.running = 0
+		self.finished = dict((result, 0) for result in self.results)
+		self.sftp_bytes = {"put": 0, "get": 0}
+
+		# histograms, (name, label value) -> [bucket counts..., count, sum]
+		self.histograms = {}
+		self.written = 0
+		self.server = None
+
+	# called by Reporter when scheduler's counters change
+	def progress(self, queued, running, finished, total):
+		with self.lock:
+			self.queued = queued
+			self.running = running
+
+		self.update_file()
+
+	def add(self, router_result):
+		with self.lock:
+			self.finished[router_result.result] = self.finished.get(router_result.result, 0) + 1
+
+			for operation, phase, duration, nbytes in router_result.timings:
+				if phase == "connect" or phase == "auth" or phase == "pool-session":
+					self.observe("cossh_ssh_login_seconds", "phase", phase, duration, self.connect_buckets)
+
+				elif phase == "operation":
+					self.observe("cossh_operation_duration_seconds", "operation", operation, duration, self.operation_buckets)
+
+				elif phase == "sftp-put" or phase == "sftp-get":
+					self.sftp_bytes[phase[5:]] += nbytes or 0
+
+		self.update_file()
+
+	def observe(self, name, label, value, duration, buckets):
+		histogram = self.histograms.setdefault((name, label, value), [0] * (len(buckets) + 2))
+
+		for index, bound in enumerate(buckets):
+			if duration <= bound:
+				histogram[index] += 1
+
+		histogram[-2] += 1
+		histogram[-1] += duration
+
+	def render(self):
+		lines = []
+
+		with self.lock:
+			lines.append("# HELP cossh_routers_queued Routers waiting for a worker.")
+			lines.append("# TYPE cossh_routers_queued gauge")
+			lines.append("cossh_routers_queued " + str(self.queued))
+			lines.append("# HELP cossh_routers_in_flight Routers being configured.")
+			lines.append("# TYPE cossh_routers_in_flight gauge")
+			lines.append("cossh_routers_in_flight " + str(self.running))
+			lines.append("# HELP cossh_routers_finished_total Routers finished, by result (a retried router is counted for every attempt).")
+			lines.append("# TYPE cossh_routers_finished_total counter")
+
+			for result, count in sorted(self.finished.items()):
+				lines.append("cossh_routers_finished_total{result=\"" + result + "\"} " + str(count))
+
+			lines.append("# HELP cossh_sftp_bytes_total Bytes transferred with SFTP.")
+			lines.append("# TYPE cossh_sftp_bytes_total counter")
+
+			for direction, count in sorted(self.sftp_bytes.items()):
+				lines.append("cossh_sftp_bytes_total{direction=\"" + direction + "\"} " + str(count))
+
+			for name, buckets, help_text in (("cossh_ssh_login_seconds", self.connect_buckets, "Duration of TCP connection, SSH authentication and pool session of routers."),
+							 ("cossh_operation_duration_seconds", self.operation_buckets, "Duration of cossh functions (functions combined with --batch together).")):
+				lines.append("# HELP " + name + " " + help_text)
+				lines.append("# TYPE " + name + " histogram")
+
+				for (histogram_name, label, value), histogram in sorted(self.histograms.items()):
+					if histogram_name != name:
+						continue
+
+					label_text = label + "=\"" + self.escape(value) + "\""
+
+					for bound, count in zip(buckets, histogram):
+						lines.append(name + "_bucket{" + label_text + ",le=\"" + str(bound) + "\"} " + str(count))
+
+					lines.append(name + "_bucket{" + label_text + ",le=\"+Inf\"} " + str(histogram[-2]))
+					lines.append(name + "_count{" + label_text + "} " + str(histogram[-2]))
+					lines.append(name + "_sum{" + label_text + "} " + str(round(histogram[-1], 6)))
+
+		return "\n".join(lines) + "\n"
+
+	@staticmethod
+	def escape(value):
+		return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+	# textfile collector reads whole files, so the file is replaced instead of rewritten
+	def update_file(self, force=False):
+		if self.metrics_file == None or (force == False and time.time() - self.written < self.file_interval):
+			return
+
+		self.written = time.time()
+		temp_file = self.metrics_file + ".tmp"
+
+		with open(temp_file, "w") as mf:
+			mf.write(self.render())
+
+		os.replace(temp_file, self.metrics_file)
+
+	# serves metrics at http://<address>:<port>/metrics from a thread of this process
+	def serve(self, port, address=""):
+		metrics = self
+
+		class MetricsHandler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+					self.send_error(404)
+					return
+
+				data = metrics.render().encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+				self.send_header("Content-Length", str(len(data)))
+				self.end_headers()
+				self.wfile.write(data)
+
+			# scrapes are not logged to the terminal
+			def log_message(self, *args):
+				pass
+
+		self.server = MetricsServer((address, port), MetricsHandler)
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+	def close(self):
+		self.update_file(True)
+
+		if self.server != None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
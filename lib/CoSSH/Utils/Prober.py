@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import sys
+import time
+import shutil
+import subprocess
+import asyncio
+from termcolor import colored
+from CoSSH.Utils.Scheduler import Scheduler
+
+class Prober(Scheduler):
+
+	# a probe only waits for a single packet or handshake, so a lot of them fit in one process
+	workers_per_cpu = 128
+
+	# only the probe's own socket is held
+	fds_per_worker = 1
+
+	methods = ("tcp", "icmp")
+
+	def __init__(self, method="tcp", port=22, timeout=2, retries=0, max_parallel=None, silent=False):
+		if method not in self.methods:
+			raise ValueError("Invalid probe method '" + str(method) + "' (use " + " or ".join(self.methods) + ")")
+
+		Scheduler.__init__(self, max_parallel, silent)
+
+		self.method = method
+		self.port = port
+		self.timeout = timeout
+		self.retries = max(0, retries)
+		self.warned = set()
+
+	# probes every host, returns {host: (online, seconds to answer or None)}
+	# hosts answering before the timeout are online, the rest are tried again retries times
+	def probe(self, hosts):
+		hosts = list(dict.fromkeys(hosts))
+
+		if len(hosts) == 0:
+			return {}
+
+		# fping sends the pings of all hosts from one process, if it fails hosts are pinged one by one
+		if self.method == "icmp" and shutil.which("fping") != None:
+			results = self.fping(hosts)
+
+			if results != None:
+				return results
+
+		loop = asyncio.new_event_loop()
+
+		try:
+			return loop.run_until_complete(self.probe_all(hosts))
+		finally:
+			loop.close()
+
+	# splits hosts into (online, offline) lists, both in the given order
+	def split(self, hosts):
+		results = self.probe(hosts)
+		online = [host for host in hosts if results[host][0] == True]
+		offline = [host for host in hosts if results[host][0] != True]
+
+		return online, offline
+
+	async def probe_all(self, hosts):
+		limit = asyncio.Semaphore(max(1, min(self.max_parallel, len(hosts))))
+		results = await asyncio.gather(*[self.probe_one(limit, host) for host in hosts])
+
+		return dict(zip(hosts, results))
+
+	async def probe_one(self, limit, host):
+		async with limit:
+			for attempt in range(self.retries + 1):
+				started = time.monotonic()
+
+				if self.method == "tcp":
+					online = await self.tcp(host)
+				else:
+					online = await self.ping(host)
+
+				if online == True:
+					return True, round(time.monotonic() - started, 4)
+
+			return False, None
+
+	# router accepting a connection to the port is online, a refused connection means SSH can't be used either
+	async def tcp(self, host):
+		try:
+			reader, writer = await asyncio.wait_for(asyncio.open_connection(host, self.port), self.timeout)
+			writer.close()
+			return True
+
+		except (OSError, asyncio.TimeoutError):
+			return False
+
+	# a single ping without shell, used when fping isn't installed or failed
+	# ping exits with 1 when the host didn't answer, if it can't be run or fails otherwise the TCP probe is used
+	async def ping(self, host):
+		try:
+			process = await asyncio.create_subprocess_exec("ping", "-c", "1", "-W", str(max(1, int(round(self.timeout)))), host,
+								      stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+		except OSError as e:
+			self.warn("ping", "Can't run ping (" + str(e) + "), routers are probed with TCP port " + str(self.port) + " instead")
+			return await self.tcp(host)
+
+		try:
+			cmd_error = (await asyncio.wait_for(process.communicate(), self.timeout + 1))[1]
+
+		except asyncio.TimeoutError:
+			process.kill()
+			await process.wait()
+			return False
+
+		if process.returncode > 1:
+			self.warn("ping", "ping failed (" + self.error_text(cmd_error, process.returncode) + "), routers are probed with TCP port " + str(self.port) + " instead")
+			return await self.tcp(host)
+
+		return process.returncode == 0
+
+	# one fping process pings every host, alive hosts are printed as "<host> is alive (<ms> ms)"
+	# fping exits with 1 when some hosts didn't answer, an error (2 and above) returns None instead of offline hosts
+	def fping(self, hosts):
+		results = dict((host, (False, None)) for host in hosts)
+		cmd = ["fping", "-e", "-r", str(self.retries), "-t", str(int(self.timeout * 1000)), "-i", "1"] + hosts
+
+		try:
+			completed = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		except OSError as e:
+			self.warn("fping", "Can't run fping (" + str(e) + "), routers are pinged one by one instead")
+			return None
+
+		if completed.returncode > 1:
+			self.warn("fping", "fping failed (" + self.error_text(completed.stderr, completed.returncode) + "), routers are pinged one by one instead")
+			return None
+
+		for line in completed.stdout.decode("utf-8", "replace").splitlines():
+			fields = line.split()
+
+			if len(fields) >= 3 and fields[0] in results and fields[2] == "alive":
+				try:
+					rtt = round(float(fields[3].strip("(")) / 1000, 4)
+				except (IndexError, ValueError):
+					rtt = None
+
+				results[fields[0]] = (True, rtt)
+
+		return results
+
+	# last line of a failed command's stderr, or its exit status
+	def error_text(self, cmd_error, returncode):
+		lines = cmd_error.decode("utf-8", "replace").strip().splitlines()
+
+		if len(lines) > 0:
+			return lines[-1]
+
+		return "exit status " + str(returncode)
+
+	# a failing probe command is reported once, on stderr so JSON written to stdout stays valid
+	def warn(self, command, message):
+		if command not in self.warned:
+			self.warned.add(command)
+			print(colored(message, "red"), file=sys.stderr)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import sys
+import json
+import time
+from collections import namedtuple
+from termcolor import colored
+
+# result of a single router, configuration processes return it to the parent
+# result is "done", "failed", "retry" (connection failed or was lost) or "unreachable" (didn't answer preflight probe)
+# operations are OperationResults in the order they were run, message tells why the router wasn't configured
+# timings are the router's timing records (see RouterTiming), empty without --timing and metrics
+RouterResult = namedtuple("RouterResult", ["ip", "result", "operations", "message", "attempt", "duration", "timings"])
+
+# line is the operation's line in cossh configuration file, 0 is router's configuration file given with -c
+OperationResult = namedtuple("OperationResult", ["line", "name", "message", "status"])
+
+# the only writer of router results and progress, results are handed to add() in the parent as routers finish
+#
+# on a terminal, a progress bar with counts of results stays on the last line and details of routers are
+# printed above it, only routers that weren't done if details go to a log file
+# with json_output, only the results are printed, as JSON lines
+# silent reporter only counts results and writes the log file, output strings aren't built at all
+# metrics (CoSSH.Utils.Metrics) get every result and progress change as well
+class Reporter():
+
+	results = ("done", "failed", "retry", "unreachable")
+
+	bar_width = 30
+
+	# progress bar is redrawn at most this often (seconds), terminals are slow with thousands of routers
+	redraw_interval = 0.2
+
+	def __init__(self, cfgfile, silent=False, log_file=None, json_output=False, stream=None, metrics=None):
+		if stream == None:
+			stream = sys.stdout
+
+		self.cfgfile = cfgfile
+		self.silent = silent
+		self.json_output = json_output
+		self.stream = stream
+		self.metrics = metrics
+		self.use_bar = silent == False and json_output == False and stream.isatty()
+
+		# latest result of every router, a retried router is counted by its last attempt
+		self.latest = {}
+
+		self.queued = 0
+		self.running = 0
+		self.finished = 0
+		self.total = 0
+		self.bar_shown = False
+		self.drawn = 0
+		self.log = None
+
+		if log_file != None:
+			self.log = open(log_file, "a")
+
+	# counts of latest results
+	def counts(self):
+		counts = dict((result, 0) for result in self.results)
+
+		for result in self.latest.values():
+			counts[result] = counts.get(result, 0) + 1
+
+		return counts
+
+	# called by Scheduler when its counters change
+	def progress(self, queued, running, finished, total):
+		self.queued = queued
+		self.running = running
+		self.finished = finished
+		self.total = total
+
+		if self.metrics != None:
+			self.metrics.progress(queued, running, finished, total)
+
+		if self.silent == True or self.json_output == True:
+			return
+
+		if self.use_bar == True:
+			self.draw_bar(finished == total)
+
+		# without a terminal, progress is printed every 5 % instead of a bar
+		elif finished == total or finished % max(1, total // 20) == 0:
+			self.stream.write(self.progress_text() + "\n")
+			self.stream.flush()
+
+	def add(self, router_result):
+		if router_result == None:
+			return
+
+		self.latest[router_result.ip] = router_result.result
+
+		if self.metrics != None:
+			self.metrics.add(router_result)
+
+		if self.log != None:
+			self.log.write("".join(router_result.ip + ": " + line + "\n" for line, color in self.router_lines(router_result)))
+			self.log.flush()
+
+		if self.silent == True:
+			return
+
+		if self.json_output == True:
+			self.stream.write(json.dumps(self.router_json(router_result)) + "\n")
+			self.stream.flush()
+			return
+
+		if self.log != None and router_result.result == "done":
+			return
+
+		self.write_lines("".join(router_result.ip + ": " + colored(line, color) + "\n" for line, color in self.router_lines(router_result)))
+
+	# prints a line about the whole run, like retries and summary
+	def note(self, text, color="yellow"):
+		if self.silent == False and self.json_output == False:
+			self.write_lines(colored(text, color) + "\n")
+
+	# lines are printed above the progress bar
+	def write_lines(self, lines):
+		if self.bar_shown == True:
+			lines = "\r\033[K" + lines
+
+		self.stream.write(lines)
+		self.stream.flush()
+
+		if self.bar_shown == True:
+			self.draw_bar(True)
+
+	# (text, color) of every line of a router, the log file gets the text without colors
+	def router_lines(self, router_result):
+		lines = []
+
+		for operation in router_result.operations:
+			if operation.status == 0:
+				lines.append((operation.message, "green"))
+			elif operation.status == 1:
+				lines.append((operation.message, "yellow"))
+			elif operation.line == 0:
+				lines.append((operation.message + " - (command-line parameter)", "red"))
+			else:
+				lines.append((operation.message + " - (" + self.cfgfile + ", line " + str(operation.line) + ")", "red"))
+
+		if router_result.message != "":
+			lines.append((router_result.message, "red"))
+
+		return lines
+
+	def router_json(self, router_result):
+		data = router_result._asdict()
+		data["operations"] = [operation._asdict() for operation in router_result.operations]
+		del data["timings"]
+		return data
+
+	def progress_text(self):
+		counts = self.counts()
+		return str(self.finished) + "/" + str(self.total) + " finished, running: " + str(self.running) + ", " + ", ".join(result + ": " + str(counts[result]) for result in self.results)
+
+	def draw_bar(self, force=False):
+		if force == False and time.time() - self.drawn < self.redraw_interval:
+			return
+
+		filled = self.bar_width * self.finished // max(1, self.total)
+		bar = "[" + "#" * filled + "." * (self.bar_width - filled) + "] "
+
+		self.stream.write("\r\033[K" + colored(bar + self.progress_text(), "yellow"))
+		self.stream.flush()
+		self.bar_shown = True
+		self.drawn = time.time()
+
+	# ends the progress bar line, and closes the log file
+	def close(self):
+		if self.bar_shown == True:
+			self.stream.write("\n")
+			self.stream.flush()
+			self.bar_shown = False
+
+		if self.log != None:
+			self.log.close()
+			self.log = None
+
+		if self.metrics != None:
+			self.metrics.close()
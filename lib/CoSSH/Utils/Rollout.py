@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import math
+import time
+
+# rollout of a group in waves, so a bad configuration doesn't reach the whole group at once
+#
+# a canary share of the group is configured first, then the rest in waves of wave_size routers with
+# wave_pause seconds between waves; before every wave the failures of routers configured so far are
+# checked, and the rollout halts when their share is above halt_threshold percent
+# routers that lost their connection (retry) count as failures, routers not answering preflight don't
+class Rollout():
+
+	failures = ("failed", "retry")
+
+	def __init__(self, canary=0, wave_size=None, wave_pause=0, halt_threshold=None):
+		self.canary = max(0, canary)
+		self.wave_size = wave_size
+		self.wave_pause = max(0, wave_pause)
+		self.halt_threshold = halt_threshold
+
+		# wave the rollout halted before (1 is the first wave), None if it wasn't halted
+		self.halted_at = None
+		self.rate = 0.0
+
+	# splits items into waves, the canary wave has at least one item if canary is given
+	def waves(self, items):
+		rest = list(items)
+		waves = []
+
+		if self.canary > 0 and len(rest) > 0:
+			count = min(len(rest), max(1, int(math.ceil(len(rest) * self.canary / 100.0))))
+			waves.append(rest[:count])
+			rest = rest[count:]
+
+		if self.wave_size == None or self.wave_size < 1:
+			size = max(1, len(rest))
+		else:
+			size = self.wave_size
+
+		for start in range(0, len(rest), size):
+			waves.append(rest[start:start + size])
+
+		return waves
+
+	# failed routers in percent of routers configured, results are result strings of the routers
+	def failure_rate(self, results):
+		configured = [result for result in results if result != None and result != "unreachable"]
+
+		if len(configured) == 0:
+			return 0.0
+
+		return 100.0 * len([result for result in configured if result in self.failures]) / len(configured)
+
+	# runs waves one by one with scheduler, latest maps addresses to results (Reporter.latest) and
+	# address gives the address of an item, note prints lines about the rollout
+	# returns items that weren't run because the rollout halted
+	def run(self, scheduler, func, items, latest, address=lambda item: item, note=print):
+		waves = self.waves(items)
+		started = []
+
+		# same as Scheduler, empty groups are reported by the caller
+		if len(waves) == 0:
+			raise ValueError("Nothing to roll out")
+
+		for number, wave in enumerate(waves, 1):
+			if number > 1:
+				self.rate = self.failure_rate([latest.get(address(item)) for item in started])
+
+				if self.halt_threshold != None and self.rate > self.halt_threshold:
+					self.halted_at = number
+					return [item for later in waves[number - 1:] for item in later]
+
+				if self.wave_pause > 0:
+					note("Failure rate " + str(round(self.rate, 1)) + "%, next wave in " + str(self.wave_pause) + " seconds")
+					time.sleep(self.wave_pause)
+
+			if len(waves) > 1:
+				name = "canary" if number == 1 and self.canary > 0 else "wave " + str(number) + "/" + str(len(waves))
+				note("Starting " + name + ": " + str(len(wave)) + " routers")
+
+			started.extend(wave)
+			scheduler.run(func, wave)
+
+		return []
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import os
+import time
+from termcolor import colored
+from multiprocessing import Pool
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+# runs func for an item in a worker, an exception is turned into the item's result by on_error(item, exception)
+# so that one failing item doesn't stop the rest of the run, without on_error the result is None
+class GuardedCall():
+
+	def __init__(self, func, on_error=None):
+		self.func = func
+		self.on_error = on_error
+
+	def __call__(self, item):
+		try:
+			return self.func(item)
+		except Exception as e:
+			if self.on_error == None:
+				return None
+
+			return self.on_error(item, e)
+
+class Scheduler():
+
+	# routers mostly wait on the network, so several workers per CPU core keep the host busy
+	workers_per_cpu = 8
+
+	# every worker holds a few descriptors in the parent (result pipes) and a socket in the child
+	fds_per_worker = 4
+
+	# descriptors kept aside for the parent itself (stdio, config files, keys)
+	reserved_fds = 32
+
+	# with a reporter (CoSSH.Utils.Reporter), results and progress are handed to it as routers finish
+	# with rate, at most rate routers are started per second, also over several runs
+	# on_error(item, exception) gives the result of an item whose func raised, see GuardedCall
+	def __init__(self, max_parallel=None, silent=False, reporter=None, rate=None, on_error=None):
+		if max_parallel == None or max_parallel < 1:
+			max_parallel = self.default_parallel()
+
+		if rate != None and rate <= 0:
+			rate = None
+
+		self.max_parallel = max_parallel
+		self.silent = silent
+		self.reporter = reporter
+		self.rate = rate
+		self.on_error = on_error
+		self.next_start = 0
+		self.total = 0
+		self.queued = 0
+		self.running = 0
+		self.finished = 0
+
+	# default amount of parallel workers, based on CPU count and open file descriptor limit
+	def default_parallel(self):
+		cpu_cap = (os.cpu_count() or 1) * self.workers_per_cpu
+		fd_cap = cpu_cap
+
+		if resource != None:
+			try:
+				soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+				if soft_limit != resource.RLIM_INFINITY:
+					fd_cap = (soft_limit - self.reserved_fds) // self.fds_per_worker
+			except (ValueError, OSError):
+				pass
+
+		return max(1, min(cpu_cap, fd_cap))
+
+	# feeds items through a fixed set of workers and returns results in completion order
+	def run(self, func, items):
+		results = []
+		workers = min(self.max_parallel, len(items))
+
+		self.total = len(items)
+		self.queued = self.total
+		self.running = 0
+		self.finished = 0
+
+		# Pool raises ValueError with zero workers, callers use it to detect empty groups
+		worker_pool = Pool(processes=workers)
+
+		try:
+			self.update(workers)
+
+			for result in worker_pool.imap_unordered(GuardedCall(func, self.on_error), self.throttle(items)):
+				results.append(result)
+
+				if self.reporter != None:
+					self.reporter.add(result)
+
+				self.finished += 1
+				self.update(workers)
+
+			worker_pool.close()
+
+		except BaseException:
+			worker_pool.terminate()
+			raise
+
+		finally:
+			worker_pool.join()
+
+		return results
+
+	# seconds to wait before the next item can be started, the start time is reserved for the item
+	def start_delay(self):
+		if self.rate == None:
+			return 0
+
+		now = time.monotonic()
+		start = max(now, self.next_start)
+		self.next_start = start + 1.0 / self.rate
+
+		return start - now
+
+	# hands items to the pool no faster than rate, the pool reads them from its own thread
+	def throttle(self, items):
+		for item in items:
+			delay = self.start_delay()
+
+			if delay > 0:
+				time.sleep(delay)
+
+			yield item
+
+	# recalculates queue counters, a saturated pool keeps every worker busy until the queue drains
+	def update(self, workers):
+		remaining = self.total - self.finished
+		self.running = min(workers, remaining)
+		self.queued = remaining - self.running
+		self.report()
+
+	# prints progress of the run
+	def report(self):
+		if self.reporter != None:
+			self.reporter.progress(self.queued, self.running, self.finished, self.total)
+			return
+
+		if self.silent == True:
+			return
+
+		print(colored("Queued: " + str(self.queued) + ", running: " + str(self.running) + ", finished: " + str(self.finished) + "/" + str(self.total), "yellow"))
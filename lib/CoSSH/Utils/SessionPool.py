@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import os
+import stat
+import time
+import hashlib
+import tempfile
+import threading
+import paramiko
+from collections import OrderedDict
+from multiprocessing.connection import Listener, Client
+from CoSSH.Utils.Transfer import SFTPTransfer
+
+# sessions are shared through a unix socket which only the user running cossh-pool can access
+# the socket is in $XDG_RUNTIME_DIR/cossh, or in /tmp/cossh-<uid> when XDG_RUNTIME_DIR isn't set
+# requests are authenticated with a random key stored next to the socket
+def pool_paths(socket_dir=None):
+	if socket_dir == None:
+		if os.environ.get("XDG_RUNTIME_DIR"):
+			socket_dir = os.path.join(os.environ["XDG_RUNTIME_DIR"], "cossh")
+		else:
+			socket_dir = os.path.join(tempfile.gettempdir(), "cossh-" + str(os.getuid()))
+
+	return os.path.join(socket_dir, "pool.sock"), os.path.join(socket_dir, "pool.key")
+
+# router passwords and passphrases are sent through the socket, and replies are unpickled
+# so a directory created by another user (or a symlink to one) is never used
+def check_socket_dir(socket_dir):
+	dir_stat = os.lstat(socket_dir)
+
+	if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.getuid() or stat.S_IMODE(dir_stat.st_mode) != 0o700:
+		raise PermissionError("Refusing to use '" + socket_dir + "', it must be a directory owned by uid " + str(os.getuid()) + " with mode 0700")
+
+# authenticated SSH and SFTP connection to a router held by the pool
+class Session():
+	def __init__(self, key, secret, conn, sftp):
+		self.key = key
+		self.secret = secret
+		self.conn = conn
+		self.sftp = sftp
+		self.users = 0
+		self.last_used = time.time()
+		self.lock = threading.Lock()
+
+	def close(self):
+		try:
+			self.sftp.close()
+			self.conn.close()
+		except Exception:
+			pass
+
+class SessionPool():
+
+	def __init__(self, max_size=256, idle_timeout=300):
+		self.max_size = max_size
+		self.idle_timeout = idle_timeout
+		self.sessions = OrderedDict()
+		self.keys = {}
+		self.keys_lock = threading.Lock()
+		self.lock = threading.Lock()
+
+	# returns a healthy session matching the login parameters, a new one is opened if needed
+	# params: ip, username and either password, or group and passphrase of the group's key (port is optional)
+	def acquire(self, params):
+		key = (params["ip"], params.get("port", 22), params["username"], params.get("group"))
+		secret = hashlib.sha256(repr((params.get("password"), params.get("passphrase"))).encode("utf-8")).hexdigest()
+
+		with self.lock:
+			session = self.sessions.get(key)
+
+			# sessions opened with different credentials or with a broken transport are not reused
+			if session != None and (session.secret != secret or not self.healthy(session)):
+				del self.sessions[key]
+				if session.users == 0:
+					session.close()
+				session = None
+
+			if session != None:
+				self.sessions.move_to_end(key)
+				session.users += 1
+				return session
+
+		session = self.connect(key, secret, params)
+
+		with self.lock:
+			previous = self.sessions.pop(key, None)
+			if previous != None and previous.users == 0:
+				previous.close()
+
+			session.users += 1
+			self.sessions[key] = session
+			self.evict()
+
+		return session
+
+	def release(self, session):
+		with self.lock:
+			session.users -= 1
+			session.last_used = time.time()
+
+			# sessions dropped from the pool while in use are closed by the last user
+			if session.users == 0 and self.sessions.get(session.key) is not session:
+				session.close()
+
+	def connect(self, key, secret, params):
+		conn = paramiko.SSHClient()
+		conn.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+		if params.get("group") != None:
+			conn.connect(params["ip"], port=params.get("port", 22), username=params["username"], pkey=self.group_key(params["group"], params["passphrase"]), timeout=10)
+		else:
+			conn.connect(params["ip"], port=params.get("port", 22), username=params["username"], password=params["password"], timeout=10)
+
+		return Session(key, secret, conn, SFTPTransfer.open_sftp(conn))
+
+	# group keys are decrypted once and kept in memory, also when many sessions to a group are opened at once
+	def group_key(self, group, passphrase):
+		cache_key = (group, hashlib.sha256(passphrase.encode("utf-8")).hexdigest())
+
+		with self.keys_lock:
+			if cache_key not in self.keys:
+				self.keys[cache_key] = paramiko.RSAKey.from_private_key_file("/etc/cossh/keys/cossh-key_" + group, password=passphrase)
+
+			return self.keys[cache_key]
+
+	def healthy(self, session):
+		transport = session.conn.get_transport()
+		return transport != None and transport.is_active() and transport.is_authenticated()
+
+	# closes least recently used idle sessions until the pool fits max_size
+	def evict(self):
+		for key in list(self.sessions):
+			if len(self.sessions) <= self.max_size:
+				break
+
+			if self.sessions[key].users == 0:
+				self.sessions.pop(key).close()
+
+	# closes idle sessions older than idle_timeout, and sessions that fail a keepalive
+	def reap(self):
+		now = time.time()
+
+		with self.lock:
+			for key, session in list(self.sessions.items()):
+				if session.users != 0:
+					continue
+
+				if now - session.last_used > self.idle_timeout or not self.healthy(session):
+					self.sessions.pop(key).close()
+					continue
+
+				try:
+					session.conn.get_transport().send_ignore()
+				except Exception:
+					self.sessions.pop(key).close()
+
+	def close_all(self):
+		with self.lock:
+			for session in self.sessions.values():
+				session.close()
+			self.sessions.clear()
+
+	def status(self):
+		with self.lock:
+			return [(key[0], key[3], session.users, int(time.time() - session.last_used)) for key, session in self.sessions.items()]
+
+# serves sessions of a SessionPool to cossh processes
+class PoolServer():
+
+	def __init__(self, pool, socket_dir=None, health_interval=30):
+		self.pool = pool
+		self.health_interval = health_interval
+		self.socket_path, self.key_path = pool_paths(socket_dir)
+
+	def serve_forever(self):
+		socket_dir = os.path.dirname(self.socket_path)
+
+		try:
+			os.mkdir(socket_dir, 0o700)
+		except FileExistsError:
+			pass
+
+		check_socket_dir(socket_dir)
+
+		authkey = os.urandom(32)
+		key_fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		with os.fdopen(key_fd, "wb") as key_file:
+			key_file.write(authkey)
+
+		if os.path.exists(self.socket_path):
+			os.remove(self.socket_path)
+
+		listener = Listener(self.socket_path, family="AF_UNIX", authkey=authkey)
+
+		reaper = threading.Thread(target=self.reap_forever, daemon=True)
+		reaper.start()
+
+		try:
+			while True:
+				try:
+					client = listener.accept()
+				except Exception:
+					continue
+
+				threading.Thread(target=self.handle, args=(client,), daemon=True).start()
+
+		finally:
+			listener.close()
+			self.pool.close_all()
+
+	def reap_forever(self):
+		while True:
+			time.sleep(self.health_interval)
+			self.pool.reap()
+
+	# every cossh process has its own connection to the server, sessions are released when it disconnects
+	def handle(self, client):
+		sessions = {}
+
+		try:
+			while True:
+				request = client.recv()
+
+				try:
+					client.send(("ok", self.dispatch(request, sessions)))
+				except Exception as e:
+					try:
+						client.send(("error", e))
+					except Exception:
+						client.send(("error", RuntimeError(str(e))))
+
+		except (EOFError, OSError):
+			pass
+
+		finally:
+			for session in sessions.values():
+				self.pool.release(session)
+			client.close()
+
+	def dispatch(self, request, sessions):
+		command = request[0]
+
+		if command == "connect":
+			session = self.pool.acquire(request[1])
+			session_id = len(sessions) + 1
+			while session_id in sessions:
+				session_id += 1
+			sessions[session_id] = session
+			return session_id
+
+		if command == "status":
+			return self.pool.status()
+
+		session = sessions[request[1]]
+		session.last_used = time.time()
+
+		if command == "exec":
+			ssh_stdin, ssh_stdout, ssh_stderr = session.conn.exec_command(request[2])
+			cmd_output = ssh_stdout.read()
+			cmd_error = ssh_stderr.read()
+			return ssh_stdout.channel.recv_exit_status(), cmd_output, cmd_error
+
+		if command == "sftp":
+			if request[2].startswith("_"):
+				raise AttributeError(request[2])
+
+			with session.lock:
+				return getattr(session.sftp, request[2])(*request[3], **request[4])
+
+		# file data is written by cossh-pool, the file object can't be handed to the cossh process
+		if command == "put-part":
+			with session.lock:
+				return SFTPTransfer(session.sftp, request[4]).put_part(request[2], request[3])
+
+		if command == "peer":
+			return session.conn.get_transport().getpeername()
+
+		if command == "active":
+			return self.pool.healthy(session)
+
+		if command == "release":
+			del sessions[request[1]]
+			self.pool.release(session)
+			return None
+
+		raise ValueError("Unknown request '" + str(command) + "'")
+
+# connection to cossh-pool, opens sessions which look like paramiko's SSHClient and SFTPClient
+class PoolClient():
+
+	def __init__(self, socket_dir=None):
+		socket_path, key_path = pool_paths(socket_dir)
+		check_socket_dir(os.path.dirname(socket_path))
+
+		with open(key_path, "rb") as key_file:
+			authkey = key_file.read()
+
+		self.connection = Client(socket_path, family="AF_UNIX", authkey=authkey)
+		self.lock = threading.Lock()
+
+	def call(self, *request):
+		with self.lock:
+			self.connection.send(request)
+			status, result = self.connection.recv()
+
+		if status == "error":
+			raise result
+
+		return result
+
+	# returns (conn, sftp) for a router, like ssh_login does
+	# the connection to cossh-pool is closed if the router's session can't be opened
+	def session(self, params):
+		try:
+			session_id = self.call("connect", params)
+		except BaseException:
+			self.close()
+			raise
+
+		return PooledConnection(self, session_id), PooledSFTP(self, session_id)
+
+	def close(self):
+		self.connection.close()
+
+class PooledOutput():
+	class Channel():
+		def __init__(self, exit_status):
+			self.exit_status = exit_status
+
+		def recv_exit_status(self):
+			return self.exit_status
+
+	def __init__(self, data, exit_status):
+		self.data = data
+		self.channel = PooledOutput.Channel(exit_status)
+
+	def read(self):
+		return self.data
+
+	def readlines(self):
+		return self.data.decode("utf-8", "replace").splitlines(True)
+
+class PooledConnection():
+
+	def __init__(self, client, session_id):
+		self.client = client
+		self.session_id = session_id
+		self.closed = False
+
+	def exec_command(self, command):
+		exit_status, cmd_output, cmd_error = self.client.call("exec", self.session_id, command)
+		return None, PooledOutput(cmd_output, exit_status), PooledOutput(cmd_error, exit_status)
+
+	def get_transport(self):
+		return self
+
+	def getpeername(self):
+		return self.client.call("peer", self.session_id)
+
+	def is_active(self):
+		return self.client.call("active", self.session_id)
+
+	# session stays open in the pool, only this process lets go of it
+	def close(self):
+		if self.closed == False:
+			self.closed = True
+			self.client.call("release", self.session_id)
+			self.client.close()
+
+class PooledSFTP():
+
+	def __init__(self, client, session_id):
+		self.client = client
+		self.session_id = session_id
+
+	# SFTP calls are run by cossh-pool, local paths are read and written by cossh-pool as well
+	def __getattr__(self, name):
+		def remote_call(*args, **kwargs):
+			return self.client.call("sftp", self.session_id, name, args, kwargs)
+
+		return remote_call
+
+	# cossh-pool has its own working directory, so local paths are made absolute before they are sent
+	def put(self, localpath, remotepath, *args, **kwargs):
+		return self.client.call("sftp", self.session_id, "put", (os.path.abspath(localpath), remotepath) + args, kwargs)
+
+	def get(self, remotepath, localpath, *args, **kwargs):
+		return self.client.call("sftp", self.session_id, "get", (remotepath, os.path.abspath(localpath)) + args, kwargs)
+
+	# same as SFTPTransfer.put_part, run by cossh-pool
+	def put_part(self, local_path, part_path, channels=1):
+		return self.client.call("put-part", self.session_id, os.path.abspath(local_path), part_path, channels)
+
+	def close(self):
+		pass
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from CoSSH.Utils.Scheduler import Scheduler, GuardedCall
+
+# paramiko's SSH and SFTP calls block, so every router in flight still holds a thread until it's finished
+# threads only cost a stack instead of a whole worker process, but --max-parallel routers are handled at a time
+# and the threads share one interpreter, so work done locally for every router (hashing, output) isn't spread over CPUs
+class ThreadEngine(Scheduler):
+
+	# threads are much cheaper than worker processes, so many more routers can be in flight at once
+	workers_per_cpu = 64
+
+	# only the router's socket (and its SFTP channel) is held per router
+	fds_per_worker = 2
+
+	def __init__(self, max_parallel=None, silent=False, reporter=None, rate=None, on_error=None):
+		Scheduler.__init__(self, max_parallel, silent, reporter, rate, on_error)
+		self.start_lock = threading.Lock()
+
+	# runs items in a fixed set of threads of this process and returns results in completion order
+	def run(self, func, items):
+		results = []
+		workers = min(self.max_parallel, len(items))
+
+		# same behavior as Scheduler, empty groups are reported by the caller
+		if workers < 1:
+			raise ValueError("Number of workers must be at least 1")
+
+		self.total = len(items)
+		self.queued = self.total
+		self.running = 0
+		self.finished = 0
+
+		executor = ThreadPoolExecutor(max_workers=workers)
+
+		try:
+			self.update(workers)
+
+			futures = [executor.submit(self.start, GuardedCall(func, self.on_error), item) for item in items]
+
+			# results are handed to the reporter from this thread only
+			for future in as_completed(futures):
+				result = future.result()
+				results.append(result)
+
+				if self.reporter != None:
+					self.reporter.add(result)
+
+				self.finished += 1
+				self.update(workers)
+
+		except BaseException:
+			executor.shutdown(wait=False, cancel_futures=True)
+			raise
+
+		executor.shutdown(wait=True)
+		return results
+
+	# with rate, a thread waits for the item's start time before running it
+	def start(self, call, item):
+		with self.start_lock:
+			delay = self.start_delay()
+
+		if delay > 0:
+			time.sleep(delay)
+
+		return call(item)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+import json
+import time
+from termcolor import colored
+from CoSSH.Utils.Journal import append_record
+
+# timing records of cossh runs, one JSON object per line
+#   {"time": <start as unix time>, "router": ..., "operation": ..., "phase": ..., "duration": <seconds>, "bytes": ..., "status": ...}
+#
+# phases: connect (TCP connection), auth (SSH handshake and authentication), sftp-open, pool-session,
+# exec (single remote command), sftp-put, sftp-get, operation (cossh function, or functions combined
+# with --batch) and router (whole router, status is the router's result)
+# without timing_file, records are only kept by RouterTimings (for metrics)
+class Timing():
+
+	def __init__(self, timing_file=None):
+		self.timing_file = timing_file
+
+	# recorder for a single router
+	def router(self, ip_address):
+		return RouterTiming(self, ip_address)
+
+	def write(self, record):
+		if self.timing_file != None:
+			append_record(self.timing_file, record)
+
+# records phases of a single router, operation is the cossh function being run
+# records are also kept as (operation, phase, duration, bytes), they are returned to the parent with the router's result
+class RouterTiming():
+
+	def __init__(self, timing, ip_address):
+		self.timing = timing
+		self.ip_address = ip_address
+		self.operation = None
+		self.records = []
+
+	# phase started at started (time.time()) and ended now
+	def record(self, phase, started, nbytes=None, status=None):
+		duration = round(time.time() - started, 4)
+		self.records.append((self.operation, phase, duration, nbytes))
+		self.timing.write({"time": round(started, 3), "router": self.ip_address, "operation": self.operation, "phase": phase,
+				   "duration": duration, "bytes": nbytes, "status": status})
+
+# stdout of exec_command, the command is recorded once its output is read and its exit status is known
+class TimedOutput():
+
+	def __init__(self, stream, timing):
+		self.stream = stream
+		self.timing = timing
+		self.started = time.time()
+		self.recorded = False
+		self.channel = TimedChannel(stream.channel, self)
+
+	def read(self, *args):
+		data = self.stream.read(*args)
+
+		if len(args) == 0:
+			self.channel.recv_exit_status()
+
+		return data
+
+	def readlines(self):
+		lines = self.stream.readlines()
+		self.channel.recv_exit_status()
+		return lines
+
+	def done(self, status):
+		if self.recorded == False:
+			self.recorded = True
+			self.timing.record("exec", self.started, status=status)
+
+	def __getattr__(self, name):
+		return getattr(self.stream, name)
+
+class TimedChannel():
+
+	def __init__(self, channel, output):
+		self.real_channel = channel
+		self.output = output
+
+	def recv_exit_status(self):
+		status = self.real_channel.recv_exit_status()
+		self.output.done(status)
+		return status
+
+	def __getattr__(self, name):
+		return getattr(self.real_channel, name)
+
+# aggregates timing records to percentiles per operation and phase, and lists the slowest routers
+class TimingReport():
+
+	percentiles = (50, 95, 99)
+
+	def __init__(self, timing_file):
+		self.timing_file = timing_file
+
+		# (operation, phase) -> durations
+		self.durations = {}
+
+		# router -> (duration, result) of routers
+		self.routers = {}
+
+	# a line cut short by a stopped run is ignored
+	def load(self):
+		with open(self.timing_file) as tf:
+			for line in tf:
+				try:
+					record = json.loads(line)
+				except ValueError:
+					continue
+
+				if record.get("phase") == "router":
+					self.routers[record.get("router")] = (record.get("duration", 0), record.get("status"))
+					continue
+
+				self.durations.setdefault((str(record.get("operation")), str(record.get("phase"))), []).append(record.get("duration", 0))
+
+	# nearest-rank percentile of sorted values
+	@staticmethod
+	def percentile(values, p):
+		rank = max(1, -(-len(values) * p // 100))
+		return values[int(rank) - 1]
+
+	def print_report(self, slowest=10):
+		self.load()
+
+		print(colored("Operation".ljust(28) + "Phase".ljust(14) + "Count".rjust(7) + "".join(("p" + str(p)).rjust(10) for p in self.percentiles) + "Max".rjust(10), "yellow"))
+
+		for (operation, phase), values in sorted(self.durations.items()):
+			values = sorted(values)
+			row = operation[:27].ljust(28) + phase.ljust(14) + str(len(values)).rjust(7)
+			row += "".join(("%.3f" % self.percentile(values, p)).rjust(10) for p in self.percentiles)
+			print(row + ("%.3f" % values[-1]).rjust(10))
+
+		if len(self.routers) == 0:
+			return
+
+		print(colored("\nSlowest routers".ljust(29) + "Seconds".rjust(10) + "  Result", "yellow"))
+
+		for router, (duration, result) in sorted(self.routers.items(), key=lambda item: item[1][0], reverse=True)[:slowest]:
+			print(str(router).ljust(28) + ("%.3f" % duration).rjust(10) + "  " + str(result))
+
+		durations = sorted(duration for duration, result in self.routers.values())
+		print("\n" + str(len(durations)) + " routers, " + ", ".join("p" + str(p) + " " + ("%.3f" % self.percentile(durations, p)) + " s" for p in self.percentiles))
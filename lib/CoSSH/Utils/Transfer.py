@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+#Copyright (c) 2018 Joram Puumala
+#
+#Permission is hereby granted, free of charge, to any person obtaining a copy
+#of this software and associated documentation files (the "Software"), to deal
+#in the Software without restriction, including without limitation the rights
+#to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#copies of the Software, and to permit persons to whom the Software is
+#furnished to do so, subject to the following conditions:
+#
+#The above copyright notice and this permission notice shall be included in all
+#copies or substantial portions of the Software.
+#
+#THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#SOFTWARE.
+
+
+
+
+import os
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+
+# writes local files to router over SFTP so that an interrupted transfer can be continued
+# the file is written to <remote_path>.cossh-part, which is renamed to remote_path when it's complete
+#
+# writes are pipelined, and large files can be split into ranges written at the same time over
+# several SFTP channels of the same SSH connection, each channel has its own SSH window
+class SFTPTransfer():
+
+	part_suffix = ".cossh-part"
+
+	# local file is read in blocks of this size
+	block_size = 1048576
+
+	# SSH window and maximum packet size of SFTP channels opened by cossh (paramiko defaults are 2 MB and 32 kB)
+	window_size = 16777216
+	max_packet_size = 131072
+
+	# files smaller than this are written over a single channel
+	parallel_min_size = 8388608
+
+	# channels is the amount of SFTP channels used for large files
+	def __init__(self, sftp, channels=1):
+		self.sftp = sftp
+		self.channels = channels
+
+	# opens an SFTP session with cossh's window and packet sizes, used instead of SSHClient.open_sftp()
+	def open_sftp(conn):
+		return SFTPTransfer.open_channel(conn.get_transport())
+
+	def open_channel(transport):
+		return paramiko.SFTPClient.from_transport(transport, window_size=SFTPTransfer.window_size, max_packet_size=SFTPTransfer.max_packet_size)
+
+	# size of a partially transferred file, 0 if there isn't one
+	def part_size(self, part_path):
+		try:
+			return self.sftp.stat(part_path).st_size
+		except IOError:
+			return 0
+
+	# writes the rest of the local file to part_path, starting from the size part_path already has
+	# returns the offset the transfer was continued from
+	def put_part(self, local_path, part_path):
+		size = os.path.getsize(local_path)
+		offset = self.part_size(part_path)
+
+		# a longer part can't be a beginning of this file
+		if offset > size:
+			offset = 0
+
+		# ranges written in parallel leave gaps if the transfer is interrupted, so they are only used for new files
+		# a continued part with gaps fails the md5 check of the caller and is written again
+		if offset == 0 and self.channels > 1 and size >= self.parallel_min_size:
+			self.put_ranges(local_path, part_path, size)
+			return offset
+
+		if offset > 0:
+			remote_file = self.sftp.open(part_path, "r+b")
+			remote_file.seek(offset)
+		else:
+			remote_file = self.sftp.open(part_path, "wb")
+
+		with open(local_path, "rb") as local_file, remote_file:
+			remote_file.set_pipelined(True)
+			local_file.seek(offset)
+
+			for block in iter(lambda: local_file.read(self.block_size), b""):
+				remote_file.write(block)
+
+		return offset
+
+	def put_ranges(self, local_path, part_path, size):
+		range_size = -(-size // self.channels)
+		ranges = [(start, min(start + range_size, size)) for start in range(0, size, range_size)]
+
+		# the part is created first, each channel then writes its own range into it
+		self.sftp.open(part_path, "wb").close()
+		transport = self.sftp.get_channel().get_transport()
+
+		with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+			writes = [executor.submit(self.put_range, transport, local_path, part_path, start, end) for start, end in ranges]
+
+			for write in writes:
+				write.result()
+
+	def put_range(self, transport, local_path, part_path, start, end):
+		sftp = SFTPTransfer.open_channel(transport)
+
+		try:
+			with open(local_path, "rb") as local_file, sftp.open(part_path, "r+b") as remote_file:
+				remote_file.set_pipelined(True)
+				local_file.seek(start)
+				remote_file.seek(start)
+				remaining = end - start
+
+				while remaining > 0:
+					block = local_file.read(min(self.block_size, remaining))
+
+					if block == b"":
+						raise EOFError("File '" + local_path + "' changed during transfer")
+
+					remote_file.write(block)
+					remaining -= len(block)
+
+		finally:
+			sftp.close()
+
+	# moves a complete part in place of remote_path
+	# posix-rename replaces an existing file atomically, servers without it get remove and rename
+	# a part that can't be moved (remote_path is a directory, permissions) is removed
+	def finish(self, part_path, remote_path):
+		try:
+			self.sftp.posix_rename(part_path, remote_path)
+			return
+		except IOError:
+			pass
+
+		try:
+			self.sftp.remove(remote_path)
+		except IOError:
+			pass
+
+		try:
+			self.sftp.rename(part_path, remote_path)
+		except IOError:
+			try:
+				self.sftp.remove(part_path)
+			except IOError:
+				pass
+
+			raise
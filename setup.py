@@ -76,9 +76,11 @@ setup(
         python_requires='>=3.4.*',
         data_files=[('/etc/cossh/clients', ['files/clients.txt']),
                     ('/etc/cossh/keys', ['files/keys.txt']),
-                    ('/etc/cossh/configs', ['files/configs.txt'])],
+                    ('/etc/cossh/configs', ['files/configs.txt']),
+                    ('/etc/cossh/cache', ['files/cache.txt'])],
         scripts=['bin/cossh',
 		 'bin/cossh-admin',
+		 'bin/cossh-pool',
 	],
 	cmdclass={'install': UserInstall},
         )